@@ -0,0 +1,159 @@
+"""
+Compares how the messages are checked against the answer: the lower case
+comparison the bot used before, against the answer matcher. Both run on the
+same generated chat messages, the matcher is built once per game.
+
+    python ./benchmarks/answer_benchmark.py --messages 200000 --json answers.json
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+import Levenshtein
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# pylint: disable=wrong-import-position
+from services.answer_service import AnswerMatcher, Match
+from controllers.guess_controller import HINT_REQUEST_TEXT
+
+# pylint: enable=wrong-import-position
+
+NAMES = [
+    "Pikachu",
+    "Mr. Mime",
+    "Farfetch'd",
+    "Nidoran♀",
+    "Type Null",
+    "Flabébé",
+    "Ho-Oh",
+    "Porygon-Z",
+    "Tapu Koko",
+    "Crabominable",
+]
+
+WORDS = (
+    "the a is it that what who pokemon guess i think no yes maybe lol "
+    "looks like kind of sure not easy hard wait its this one again bird "
+    "cat dog fire water grass electric psychic ghost dragon"
+).split()
+
+
+def make_variants(name: str) -> list[str]:
+    """Ways players write the right answer"""
+    plain = name.replace(".", "").replace("'", "").replace("-", " ")
+    return [name, name.lower(), plain.lower(), plain.upper(), f"  {name}!  "]
+
+
+def make_messages(rng: random.Random, name: str, count: int) -> list[str]:
+    messages = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.70:
+            # Chatting
+            messages.append(" ".join(rng.choices(WORDS, k=rng.randint(2, 12))))
+        elif kind < 0.85:
+            messages.append(rng.choice(WORDS))
+        elif kind < 0.93:
+            # Typo
+            index = rng.randrange(len(name))
+            messages.append(name[:index] + "x" + name[index + 1 :])
+        elif kind < 0.97:
+            messages.append(rng.choice(make_variants(name)))
+        else:
+            messages.append(rng.choice(sorted(HINT_REQUEST_TEXT)))
+
+    return messages
+
+
+def check_before(name: str, messages: list[str]) -> dict:
+    """The comparison made in on_message before the matcher"""
+    counts = {match.name: 0 for match in Match}
+
+    for message in messages:
+        content = message.strip().lower()
+
+        if content == name.lower():
+            counts[Match.EXACT.name] += 1
+            continue
+
+        if content in HINT_REQUEST_TEXT:
+            continue
+
+        if Levenshtein.distance(content, name.lower()) == 1:
+            counts[Match.CLOSE.name] += 1
+            continue
+
+        counts[Match.NONE.name] += 1
+
+    return counts
+
+
+def check_matcher(name: str, messages: list[str]) -> dict:
+    counts = {match.name: 0 for match in Match}
+
+    matcher = AnswerMatcher(name)
+    for message in messages:
+        match = matcher.match(message)
+
+        if match is Match.EXACT:
+            counts[match.name] += 1
+            continue
+
+        if message.strip().lower() in HINT_REQUEST_TEXT:
+            continue
+
+        counts[match.name] += 1
+
+    return counts
+
+
+def measure(check, messages_by_name: dict[str, list[str]], repeat: int) -> dict:
+    elapsed = float("inf")
+    for _ in range(repeat):
+        total = {match.name: 0 for match in Match}
+
+        start = time.perf_counter()
+        for name, messages in messages_by_name.items():
+            for key, count in check(name, messages).items():
+                total[key] += count
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    count = sum(len(messages) for messages in messages_by_name.values())
+    return {"messages_per_second": count / elapsed, **total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3, help="Keeps the fastest run")
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    messages_by_name = {
+        name: make_messages(rng, name, args.messages // len(NAMES)) for name in NAMES
+    }
+
+    results = {
+        "before": measure(check_before, messages_by_name, args.repeat),
+        "matcher": measure(check_matcher, messages_by_name, args.repeat),
+    }
+
+    print(f"{'check':<8} {'messages/s':>12} {'exact':>7} {'close':>7} {'none':>7}")
+    for name, result in results.items():
+        print(
+            f"{name:<8} {result['messages_per_second']:>12.0f} "
+            f"{result['EXACT']:>7} {result['CLOSE']:>7} {result['NONE']:>7}"
+        )
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compares the game start lookup of a random pokemon: the directory scan the
+bot used before, against the catalog index.
+
+Run from the repository root, after the images were rendered:
+
+    python ./benchmarks/catalog_benchmark.py --iterations 1000 --json catalog.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# pylint: disable=wrong-import-position
+from models.pokemon import Pokemon
+from services.image_service import TMP_FILE_PREFIX, get_encoding
+from services.archive_service import ArchiveService
+from services.catalog_service import CatalogService, HIDDEN_IMG_DIR, REVEALED_IMG_DIR
+
+# pylint: enable=wrong-import-position
+
+
+def scan_pokemon_by_id(pokemon_id: int) -> Pokemon:
+    """The lookup made on every game start before the catalog"""
+    extension = get_encoding().extension
+
+    for file in os.listdir(HIDDEN_IMG_DIR):
+        if file.startswith(TMP_FILE_PREFIX) or not file.endswith(extension):
+            continue
+
+        first_underscore = file.index("_")
+
+        if pokemon_id == int(file[0:first_underscore]):
+            last_dot = len(file) - file[::-1].index(".") - 1
+            return Pokemon(
+                id=pokemon_id,
+                name=file[first_underscore + 1 : last_dot],
+                hidden_img_path=Path(HIDDEN_IMG_DIR, file),
+                revealed_img_path=Path(REVEALED_IMG_DIR, file),
+                original_img_path=None,
+            )
+
+    return None
+
+
+def measure(start_game, iterations: int) -> dict:
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        start_game()
+        durations.append(time.perf_counter() - start)
+
+    durations.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": statistics.mean(durations) * 1e6,
+        "p50_us": durations[len(durations) // 2] * 1e6,
+        "p99_us": durations[int(len(durations) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    archive_service = ArchiveService()
+    archive_service.load()
+    catalog_service = CatalogService(archive_service=archive_service)
+
+    start = time.perf_counter()
+    catalog_service.reload()
+    reload_ms = (time.perf_counter() - start) * 1000
+
+    ids = catalog_service.get_ids()
+    if len(ids) == 0:
+        sys.exit("No rendered pokemons, run ./src/build_assets.py first")
+
+    results = {
+        "pokemons": len(ids),
+        "catalog_reload_ms": reload_ms,
+        # Picking a random id of the dex, then finding its images
+        "directory_scan": measure(
+            lambda: scan_pokemon_by_id(random.choice(ids)), args.iterations
+        ),
+        "catalog": measure(
+            lambda: catalog_service.get_pokemon(
+                random.choice(catalog_service.get_ids())
+            ),
+            args.iterations,
+        ),
+    }
+
+    print(f"{results['pokemons']} pokemons, catalog built in {reload_ms:.1f}ms")
+    print(f"{'lookup':<15} {'mean us':>10} {'p50 us':>10} {'p99 us':>10}")
+    for name in ("directory_scan", "catalog"):
+        result = results[name]
+        print(
+            f"{name:<15} {result['mean_us']:>10.1f} "
+            f"{result['p50_us']:>10.1f} {result['p99_us']:>10.1f}"
+        )
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
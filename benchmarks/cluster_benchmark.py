@@ -0,0 +1,166 @@
+"""
+Starts a bot process on the stub gateway, like the cluster launcher with
+--stub-gateway, for the first shard of the cluster. Its journal has games in
+every shard, like after the shards were split differently. Measures the time
+until the process answers on its health port and the time it takes to stop,
+then checks that the games of the other shards were kept in the journal.
+
+The journal and the render cache are in a temporary directory, the games of
+the bot are not touched.
+
+    python ./benchmarks/cluster_benchmark.py --shards 4 --games 1000 --json cluster.json
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import random
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from pathlib import Path
+from datetime import datetime, timedelta
+
+ROOT_PATH = Path(__file__).resolve().parents[1]
+MAIN_PATH = ROOT_PATH / "src" / "main.py"
+
+# Seconds given to the process to answer and to stop
+TIMEOUT = 60
+
+
+def make_records(shards: int, games: int) -> list[dict]:
+    """Start records of running games, spread over the shards"""
+    rng = random.Random(0)
+    now = datetime.utcnow()
+
+    records = []
+    for i in range(games):
+        # Snowflake of a guild in the shard i % shards
+        guild_id = (rng.randint(1, 10**9) * shards + i % shards) << 22
+        records.append(
+            {
+                "op": "start",
+                "channel": rng.randint(10**17, 10**18),
+                "guild": guild_id,
+                "pokemon": 25,
+                "file": "25_Pikachu.png",
+                "start": now.isoformat(),
+                "end": (now + timedelta(minutes=5)).isoformat(),
+                "author": 1,
+                "guesses": 0,
+                "hints": 0,
+            }
+        )
+
+    return records
+
+
+def wait_up(port: int, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The process exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+
+    raise TimeoutError("The process did not answer on its health port")
+
+
+def run_process(
+    directory: str, shards: int, journal: Path, args: argparse.Namespace
+) -> dict:
+    env = {
+        **os.environ,
+        "CLUSTER_ID": "0",
+        "CLUSTER_SHARD_IDS": "0",
+        "SHARD_COUNT": str(shards),
+        "METRICS_PORT": str(args.metrics_port),
+        "HEALTH_PORT": str(args.health_port),
+        "JOURNAL_PATH": str(journal),
+        "RENDER_CACHE_DIR": str(Path(directory, "custom_cache")),
+        "PREPARE_ASSETS": "false",
+        "STUB_GATEWAY": "true",
+        "DISCORD_BOT_TOKEN": "stub",
+    }
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(MAIN_PATH)],
+        cwd=ROOT_PATH,
+        env=env,
+        stdout=subprocess.DEVNULL if not args.verbose else None,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        wait_up(args.health_port, process)
+        up = time.perf_counter() - start
+
+        start = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        returncode = process.wait(timeout=TIMEOUT)
+        stop = time.perf_counter() - start
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+    return {"returncode": returncode, "up_ms": up * 1000, "stop_ms": stop * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--metrics-port", type=int, default=8950)
+    parser.add_argument("--health-port", type=int, default=8951)
+    parser.add_argument("--verbose", action="store_true", help="Show the bot logs")
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    records = make_records(args.shards, args.games)
+    # The process runs the first shard, where the stub gateway has no channel
+    others = {
+        record["channel"]
+        for record in records
+        if (record["guild"] >> 22) % args.shards != 0
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Path(directory, "games.journal")
+        with open(journal, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+
+        results = run_process(directory, args.shards, journal, args)
+
+        with open(journal, "r", encoding="utf-8") as f:
+            left = {json.loads(line)["channel"] for line in f}
+
+    results["other_shard_games"] = len(others)
+    results["kept"] = len(left & others)
+    results["dropped"] = len(others - left)
+    results["unexpected"] = len(left - others)
+
+    print(f"shard 0 of {args.shards}, {args.games} games in the journal")
+    print(
+        f"{'answered':<10} {'stopped':>9} {'kept':>6} {'dropped':>8} {'unexpected':>11}"
+    )
+    print(
+        f"{results['up_ms']:>8.0f}ms {results['stop_ms']:>7.0f}ms "
+        f"{results['kept']:>6} {results['dropped']:>8} {results['unexpected']:>11}"
+    )
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    if results["returncode"] != 0 or results["dropped"] or results["unexpected"]:
+        sys.exit("The games of the other shards were not kept")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Downloads the pokedex and the pokemon images from a local stand-in of the
+pokemon.com server, with several numbers of workers. The server answers some
+image requests with 429 or 503 before the image, cuts some images short of
+their Content-Length, and answers 304 when the pokedex did not change.
+
+Checks that the failed requests were retried, that the cut images were not
+saved and that the refreshed pokedex was not downloaded again.
+
+    python ./benchmarks/download_benchmark.py --pokemons 200 --latency 0.05 --json download.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# pylint: disable=wrong-import-position
+from services import pokedex_service
+from services.pokedex_service import PokedexService
+from services.image_service import TMP_FILE_PREFIX
+
+# pylint: enable=wrong-import-position
+
+ETAG = '"pokedex-1"'
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+# Pokemons whose image is answered with these errors first, then sent
+THROTTLED_EVERY = 10
+UNAVAILABLE_EVERY = 7
+# Pokemons whose image is always cut short
+TRUNCATED_EVERY = 25
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, pokemons: int, image_size: int, latency: float) -> None:
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.latency = latency
+        self.image = random.Random(0).randbytes(image_size)
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+
+        self.pokedex = [
+            {
+                "abilities": [],
+                "detailPageURL": f"/pokedex/poke{i}",
+                "weight": "0",
+                "weakness": [],
+                "number": f"{i:04}",
+                "height": 0,
+                "collectibles_slug": f"poke{i}",
+                "featured": False,
+                "slug": f"poke{i}",
+                "name": f"Poke{i}",
+                "ThumbnailAltText": f"Poke{i}",
+                "ThumbnailImage": f"{self.base_url}/images/{i}.png",
+                "id": i,
+                "type": [],
+            }
+            for i in range(1, pokemons + 1)
+        ]
+
+        # Statuses still to answer before the image, by pokemon id
+        self.failures: dict[int, list[int]] = {}
+        for i in range(1, pokemons + 1):
+            if i % THROTTLED_EVERY == 0:
+                self.failures.setdefault(i, []).append(429)
+            if i % UNAVAILABLE_EVERY == 0:
+                self.failures.setdefault(i, []).extend((503, 503))
+        self.truncated = {i for i in range(1, pokemons + 1) if i % TRUNCATED_EVERY == 0}
+
+        self.answers: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, answer: str):
+        with self._lock:
+            self.answers[answer] += 1
+
+    def next_failure(self, pokemon_id: int):
+        with self._lock:
+            failures = self.failures.get(pokemon_id)
+            return failures.pop(0) if failures else None
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real server, the session pools the connections
+    protocol_version = "HTTP/1.1"
+    # The headers and the image are written separately
+    disable_nagle_algorithm = True
+    server: StandInServer
+
+    def do_GET(self):
+        if self.path == "/api/pokedex":
+            self.send_pokedex()
+        elif self.path.startswith("/images/"):
+            time.sleep(self.server.latency)
+            self.send_pokemon_image(int(Path(self.path).stem))
+        else:
+            self.send_error(404)
+
+    def send_pokedex(self):
+        if self.headers.get("If-None-Match") == ETAG:
+            self.server.count("pokedex 304")
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.server.count("pokedex 200")
+        body = json.dumps(self.server.pokedex).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_pokemon_image(self, pokemon_id: int):
+        status = self.server.next_failure(pokemon_id)
+        if status is not None:
+            self.server.count(f"image {status}")
+            self.send_response(status)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        image = self.server.image
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(image)))
+        self.end_headers()
+
+        if pokemon_id in self.server.truncated:
+            # The connection drops in the middle of the image
+            self.server.count("image truncated")
+            self.wfile.write(image[: len(image) // 2])
+            self.close_connection = True
+            return
+
+        self.server.count("image 200")
+        self.wfile.write(image)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def measure(workers: int, args: argparse.Namespace) -> dict:
+    server = StandInServer(args.pokemons, args.image_kb * 1024, args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pokedex_service.POKEDEX_URL = f"{server.base_url}/api/pokedex"
+
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            service = PokedexService(
+                workers=workers, requests_per_second=args.rate, retries=3
+            )
+
+            start = time.perf_counter()
+            service.download_all_pokemon()
+            elapsed = time.perf_counter() - start
+
+            # Nothing changed, the pokedex must not be downloaded again
+            changed = service.refresh_pokedex()
+
+            files = os.listdir(pokedex_service.OUT_DIR)
+        finally:
+            os.chdir(cwd)
+            server.shutdown()
+            server.server_close()
+
+    downloaded = [file for file in files if not file.startswith(TMP_FILE_PREFIX)]
+    saved_truncated = [
+        file for file in downloaded if int(file.split("_")[0]) in server.truncated
+    ]
+
+    return {
+        "seconds": elapsed,
+        "images_per_second": len(downloaded) / elapsed,
+        "downloaded": len(downloaded),
+        "expected": args.pokemons - len(server.truncated),
+        "saved_truncated": len(saved_truncated),
+        "temporary_files": len(files) - len(downloaded),
+        "refresh_changed": len(changed),
+        "answers": dict(server.answers),
+    }
+
+
+def check(result: dict) -> list[str]:
+    problems = []
+    if result["downloaded"] != result["expected"]:
+        problems.append(
+            f"downloaded {result['downloaded']} of {result['expected']} images"
+        )
+    if result["saved_truncated"] > 0:
+        problems.append(f"saved {result['saved_truncated']} truncated images")
+    if result["temporary_files"] > 0:
+        problems.append(f"left {result['temporary_files']} temporary files")
+    if result["answers"].get("pokedex 304") != 1 or result["refresh_changed"] > 0:
+        problems.append("downloaded the pokedex again when it did not change")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pokemons", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=40)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="Seconds before each image"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Requests per second, 0 for no limit"
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    # The truncated images are logged as failed downloads
+    logging.disable(logging.ERROR)
+
+    results = {str(workers): measure(workers, args) for workers in args.workers}
+
+    print(f"{args.pokemons} pokemons, {args.latency * 1000:.0f}ms before each image")
+    print(
+        f"{'workers':<8} {'time':>8} {'images/s':>9} {'saved':>6} "
+        f"{'429':>5} {'503':>5} {'cut':>5} {'304':>5}"
+    )
+    problems = []
+    for workers, result in results.items():
+        answers = result["answers"]
+        print(
+            f"{workers:<8} {result['seconds']:>7.2f}s "
+            f"{result['images_per_second']:>9.1f} {result['downloaded']:>6} "
+            f"{answers.get('image 429', 0):>5} {answers.get('image 503', 0):>5} "
+            f"{answers.get('image truncated', 0):>5} {answers.get('pokedex 304', 0):>5}"
+        )
+        problems += [f"{workers} workers: {problem}" for problem in check(result)]
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    if len(problems) > 0:
+        sys.exit("\n".join(problems))
+
+
+if __name__ == "__main__":
+    main()
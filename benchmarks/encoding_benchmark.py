@@ -0,0 +1,124 @@
+"""
+Compares the image encodings on the rendered pokemons: bytes per image,
+encode and decode time, and how close the decoded image is to the render.
+
+Run from the repository root, after the images were downloaded:
+
+    python ./benchmarks/encoding_benchmark.py --limit 100 --json encodings.json
+"""
+
+import io
+import sys
+import json
+import math
+import time
+import argparse
+from pathlib import Path
+from PIL import Image, ImageChops, ImageStat
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# pylint: disable=wrong-import-position
+from services.image_service import ImageService, ENCODINGS
+from services.asset_service import ORIGINAL_DIR
+
+# pylint: enable=wrong-import-position
+
+
+def psnr(expected: Image.Image, actual: Image.Image) -> float:
+    """Peak signal to noise ratio in dB, infinite when both images are identical"""
+    diff = ImageChops.difference(expected, actual.convert(expected.mode))
+    mse = sum(ImageStat.Stat(diff).sum2) / (expected.size[0] * expected.size[1] * 4)
+
+    if mse == 0:
+        return math.inf
+
+    return 10 * math.log10(255**2 / mse)
+
+
+def render_all(limit: int) -> list[Image.Image]:
+    image_service = ImageService()
+
+    renders = []
+    for file in sorted(ORIGINAL_DIR.iterdir())[:limit]:
+        renders.extend(image_service.render_image(Image.open(file)))
+
+    return renders
+
+
+def benchmark(renders: list[Image.Image]) -> dict:
+    results = {}
+
+    for name in ENCODINGS:
+        image_service = ImageService(encoding=name)
+
+        total_bytes = 0
+        encode_time = 0.0
+        decode_time = 0.0
+        lossless = 0
+        lowest_psnr = math.inf
+
+        for render in renders:
+            buffer = io.BytesIO()
+
+            start = time.perf_counter()
+            image_service.encode_image(render, buffer)
+            encode_time += time.perf_counter() - start
+
+            total_bytes += buffer.tell()
+            buffer.seek(0)
+
+            start = time.perf_counter()
+            decoded = Image.open(buffer)
+            decoded.load()
+            decode_time += time.perf_counter() - start
+
+            score = psnr(render, decoded)
+            lowest_psnr = min(lowest_psnr, score)
+            if score == math.inf:
+                lossless += 1
+
+        count = len(renders)
+        results[name] = {
+            "images": count,
+            "bytes_per_image": total_bytes / count,
+            "encode_ms": encode_time / count * 1000,
+            "decode_ms": decode_time / count * 1000,
+            "lossless_ratio": lossless / count,
+            "min_psnr_db": None if lowest_psnr == math.inf else lowest_psnr,
+        }
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--limit", type=int, default=None, help="Only use the first N pokemons"
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    renders = render_all(args.limit)
+    results = benchmark(renders)
+
+    print(
+        f"{'encoding':<15} {'bytes/img':>10} {'encode ms':>10} "
+        f"{'decode ms':>10} {'lossless':>9} {'min PSNR':>9}"
+    )
+    for name, result in results.items():
+        min_psnr = result["min_psnr_db"]
+        print(
+            f"{name:<15} {result['bytes_per_image']:>10.0f} "
+            f"{result['encode_ms']:>10.2f} {result['decode_ms']:>10.2f} "
+            f"{result['lossless_ratio']:>9.0%} "
+            f"{'inf' if min_psnr is None else f'{min_psnr:.1f}':>9}"
+        )
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
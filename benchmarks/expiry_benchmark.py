@@ -0,0 +1,176 @@
+"""
+Compares how guessers are ended at their end time: the loop that scanned
+every guesser each second, against the timers of the guesser service.
+
+Both run the same simulated games, half of them are won before their end:
+
+    python ./benchmarks/expiry_benchmark.py --guessers 100000 --json expiry.json
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# pylint: disable=wrong-import-position
+from models.guesser import Guesser
+from models.pokemon import Pokemon
+from services.guesser_service import GuesserService, log
+
+# pylint: enable=wrong-import-position
+
+
+class ScanningGuesserService(GuesserService):
+    """Ends the guessers like the bot did before the timers"""
+
+    def add_guesser(self, guesser: Guesser) -> None:
+        log.info(
+            f"Creating a guesser for pokemon #{guesser.pokemon.id} in channel {guesser.channel.id}"
+        )
+
+        self.active_guess[guesser.channel.id] = guesser
+
+    async def end_guesses_loop(self, ticks: list[float]):
+        while True:
+            await asyncio.sleep(1)
+
+            start = time.perf_counter()
+            channels_ids = list(self.active_guess.keys())
+
+            for channel_id in channels_ids:
+                guesser = self.get_guesser(channel_id)
+
+                if guesser.end_time < datetime.utcnow():
+                    await self.end_guesser(guesser.channel)
+            ticks.append(time.perf_counter() - start)
+
+
+def percentile(values: list[float], ratio: float) -> float:
+    return values[min(int(len(values) * ratio), len(values) - 1)]
+
+
+async def run(
+    service: GuesserService, count: int, start_after: float, duration: float
+) -> dict:
+    pokemon = Pokemon(
+        id=25,
+        name="Pikachu",
+        hidden_img_path=None,
+        revealed_img_path=None,
+        original_img_path=None,
+    )
+
+    lateness = []
+
+    async def on_end(guesser: Guesser):
+        if guesser.winner is None:
+            lateness.append((datetime.utcnow() - guesser.end_time).total_seconds())
+
+    service.on_guesser_end_event.append(on_end)
+
+    ticks = []
+    if isinstance(service, ScanningGuesserService):
+        scanner = asyncio.create_task(service.end_guesses_loop(ticks))
+
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    guessers = []
+
+    start = time.perf_counter()
+    for channel_id in range(count):
+        guesser = Guesser(
+            channel=SimpleNamespace(id=channel_id),
+            pokemon=pokemon,
+            start_time=now,
+            end_time=now + timedelta(seconds=start_after + rng.random() * duration),
+            custom=False,
+            author=None,
+        )
+        service.add_guesser(guesser)
+        guessers.append(guesser)
+    add_time = time.perf_counter() - start
+
+    # Half of the games are won right away
+    winners = guessers[::2]
+    start = time.perf_counter()
+    for guesser in winners:
+        guesser.winner = SimpleNamespace(id=0)
+        await service.end_guesser(guesser.channel)
+    win_time = time.perf_counter() - start
+
+    # Watches how long the event loop is blocked while the games expire
+    lags = []
+    while len(service.active_guess) > 0:
+        before = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - before - 0.01)
+
+    if isinstance(service, ScanningGuesserService):
+        scanner.cancel()
+
+    lateness.sort()
+    lags.sort()
+
+    return {
+        "guessers": count,
+        "add_us": add_time / count * 1e6,
+        "win_us": win_time / len(winners) * 1e6,
+        "expired": len(lateness),
+        "lateness_p50_ms": percentile(lateness, 0.5) * 1000,
+        "lateness_p99_ms": percentile(lateness, 0.99) * 1000,
+        "lateness_max_ms": lateness[-1] * 1000,
+        "loop_lag_max_ms": lags[-1] * 1000,
+        "scan_tick_max_ms": max(ticks) * 1000 if ticks else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--guessers", type=int, default=100000)
+    # The games are created before the first one ends
+    parser.add_argument("--start-after", type=float, default=5)
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=3,
+        help="The games end over this many seconds",
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    results = {
+        "scan": asyncio.run(
+            run(
+                ScanningGuesserService(), args.guessers, args.start_after, args.duration
+            )
+        ),
+        "timers": asyncio.run(
+            run(GuesserService(), args.guessers, args.start_after, args.duration)
+        ),
+    }
+
+    print(
+        f"{'expiry':<8} {'add us':>7} {'win us':>7} {'late p50 ms':>12} "
+        f"{'late p99 ms':>12} {'late max ms':>12} {'loop lag ms':>12}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<8} {result['add_us']:>7.2f} {result['win_us']:>7.2f} "
+            f"{result['lateness_p50_ms']:>12.1f} {result['lateness_p99_ms']:>12.1f} "
+            f"{result['lateness_max_ms']:>12.1f} {result['loop_lag_max_ms']:>12.1f}"
+        )
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
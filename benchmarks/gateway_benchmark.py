@@ -0,0 +1,137 @@
+"""
+Compares the memory kept for the guilds by the full and lean gateway
+profiles. The guilds are created from generated payloads by the discord.py
+connection state, the full profile receives every member like after the
+guilds are chunked, the lean profile only receives the bot.
+
+The time to ready also depends on the chunk requests sent to Discord, rate
+limited per shard, it is logged by the bot when it is ready.
+
+    python ./benchmarks/gateway_benchmark.py --guilds 2000 --members 250 --json gateway.json
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+from pathlib import Path
+from discord import ClientUser
+from discord.ext import commands
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# pylint: disable=wrong-import-position
+from main import GATEWAY_PROFILES, get_gateway_options
+
+# pylint: enable=wrong-import-position
+
+BOT_ID = 1
+
+
+def make_member(user_id: int) -> dict:
+    return {
+        "user": {
+            "id": str(user_id),
+            "username": f"user{user_id}",
+            "discriminator": "0",
+            "global_name": f"User {user_id}",
+            "avatar": None,
+        },
+        "roles": [],
+        "joined_at": "2022-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def make_guild(guild_id: int, member_ids: list[int]) -> dict:
+    return {
+        "id": str(guild_id),
+        "name": f"Guild {guild_id}",
+        "owner_id": str(member_ids[0]),
+        "member_count": len(member_ids),
+        "large": len(member_ids) > 250,
+        "roles": [],
+        "emojis": [],
+        "features": [],
+        "channels": [],
+        "members": [make_member(user_id) for user_id in member_ids],
+    }
+
+
+async def load_guilds(profile: str, guilds: list[list[int]]) -> commands.Bot:
+    bot = commands.AutoShardedBot(command_prefix="!", **get_gateway_options(profile))
+
+    # pylint: disable=protected-access
+    state = bot._connection
+    state.user = ClientUser(
+        state=state,
+        data={"id": BOT_ID, "username": "bot", "discriminator": "0", "avatar": None},
+    )
+
+    for guild_id, member_ids in enumerate(guilds, start=1):
+        # Without the members intent, Discord only sends the bot
+        if profile == "lean":
+            member_ids = [BOT_ID]
+
+        state._add_guild_from_data(make_guild(guild_id, member_ids))
+    # pylint: enable=protected-access
+
+    return bot
+
+
+def measure(profile: str, guilds: list[list[int]]) -> dict:
+    start = time.perf_counter()
+    bot = asyncio.run(load_guilds(profile, guilds))
+    elapsed = time.perf_counter() - start
+    del bot
+
+    # Again, the tracing slows it down
+    tracemalloc.start()
+    bot = asyncio.run(load_guilds(profile, guilds))
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "guilds": len(bot.guilds),
+        "members_cached": sum(len(guild.members) for guild in bot.guilds),
+        "memory_mb": memory / 1024 / 1024,
+        "parse_ms": elapsed * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--guilds", type=int, default=2000)
+    parser.add_argument(
+        "--members", type=int, default=250, help="Average members by guild"
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    guilds = []
+    for _ in range(args.guilds):
+        count = max(1, int(rng.expovariate(1 / args.members)))
+        guilds.append([BOT_ID, *rng.sample(range(2, 10**9), count)])
+
+    results = {profile: measure(profile, guilds) for profile in GATEWAY_PROFILES}
+
+    print(f"{'profile':<8} {'guilds':>7} {'members':>9} {'memory':>10} {'parse':>10}")
+    for profile, result in results.items():
+        print(
+            f"{profile:<8} {result['guilds']:>7} {result['members_cached']:>9} "
+            f"{result['memory_mb']:>8.1f}MB {result['parse_ms']:>8.0f}ms"
+        )
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Measures the game journal: the cost of journaling the games while the bot
+runs, and the recovery time of the games on the next start.
+
+Runs in a temporary directory, nothing is written in ./pokemons:
+
+    python ./benchmarks/journal_benchmark.py --games 50000 --json journal.json
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# pylint: disable=wrong-import-position
+from models.guesser import Guesser
+from services.catalog_service import make_pokemon
+from services.guesser_service import GuesserService
+from services.journal_service import JournalService
+
+# pylint: enable=wrong-import-position
+
+
+# Looked up like the catalog does
+POKEMONS = {
+    pokemon_id: make_pokemon(f"{pokemon_id}_Poke{pokemon_id}.png")
+    for pokemon_id in range(1, 906)
+}
+
+
+async def journal_games(path: Path, games: int, active: int) -> dict:
+    """Plays the games on a journaled guesser service, only `active` are left running"""
+    journal_service = JournalService(path)
+    # Written by hand, the loop would rewrite the journal
+    journal_service.flush_loop.cancel()  # pylint: disable=no-member
+    guesser_service = GuesserService(journal_service=journal_service)
+
+    rng = random.Random(0)
+    now = datetime.utcnow()
+    guessers = []
+
+    start = time.perf_counter()
+    for channel_id in range(games):
+        guesser = Guesser(
+            channel=SimpleNamespace(id=channel_id),
+            pokemon=POKEMONS[rng.randint(1, 905)],
+            start_time=now,
+            # Half of the active games expire while the bot is offline
+            end_time=now + timedelta(seconds=rng.choice((-30, 300))),
+            custom=False,
+            author=SimpleNamespace(id=rng.randint(0, 10**18)),
+        )
+        guesser_service.add_guesser(guesser)
+        guessers.append(guesser)
+
+        if rng.random() < 0.3:
+            guesser_service.add_hint(guesser)
+
+    for guesser in guessers[active:]:
+        guesser.winner = guesser.author
+        await guesser_service.end_guesser(guesser.channel)
+    record_time = time.perf_counter() - start
+
+    # Appended in one batch, then the bot crashes
+    # pylint: disable=protected-access
+    records = len(journal_service._buffer)
+    start = time.perf_counter()
+    await asyncio.to_thread(journal_service._write, "".join(journal_service._buffer))
+    flush_time = time.perf_counter() - start
+    # pylint: enable=protected-access
+
+    return {
+        "records": records,
+        "journal_bytes": path.stat().st_size,
+        "record_us": record_time / records * 1e6,
+        "flush_ms": flush_time * 1000,
+    }
+
+
+async def recover(path: Path) -> dict:
+    """Restores the games like the guess controller does on the first connection"""
+    start = time.perf_counter()
+
+    journal_service = JournalService(path)
+    # Written by hand, the loop would rewrite the journal
+    journal_service.flush_loop.cancel()  # pylint: disable=no-member
+    guesser_service = GuesserService(journal_service=journal_service)
+
+    records = journal_service.load()
+    load_time = time.perf_counter() - start
+
+    now = datetime.utcnow()
+    expired = 0
+    for record in records:
+        guesser = Guesser(
+            channel=SimpleNamespace(id=record["channel"]),
+            pokemon=POKEMONS[record["pokemon"]],
+            start_time=record["start"],
+            end_time=record["end"],
+            custom=False,
+            author=SimpleNamespace(id=record["author"]),
+            total_guesses=record["guesses"],
+        )
+        guesser.hints_given = record["hints"]
+        guesser_service.add_guesser(guesser, restored=True)
+
+        if guesser.end_time < now:
+            expired += 1
+    recovery_time = time.perf_counter() - start
+
+    return {
+        "restored": len(records),
+        "expired": expired,
+        "load_ms": load_time * 1000,
+        "recovery_ms": recovery_time * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--games", type=int, default=50000)
+    parser.add_argument(
+        "--active", type=int, default=20000, help="Games still running at the crash"
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory, "games.journal")
+        results = {
+            "games": args.games,
+            **asyncio.run(journal_games(path, args.games, args.active)),
+            **asyncio.run(recover(path)),
+        }
+
+    print(
+        f"{results['games']} games, {results['records']} records "
+        f"({results['journal_bytes']} bytes), "
+        f"{results['record_us']:.1f}us per game event"
+    )
+    print(f"Writing the batch with fsync: {results['flush_ms']:.1f}ms")
+    print(
+        f"Restored {results['restored']} games ({results['expired']} expired) "
+        f"in {results['recovery_ms']:.1f}ms, replay {results['load_ms']:.1f}ms"
+    )
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
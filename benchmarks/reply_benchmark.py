@@ -0,0 +1,137 @@
+"""
+Simulates a burst of near misses and hints in one channel, then the reveal.
+Compares one reply per message, like the bot did before, against the reply
+service. The fake channel is rate limited like Discord, 5 messages every 5
+seconds, the times are reported in seconds of that limit.
+
+    python ./benchmarks/reply_benchmark.py --messages 30 --speed 10 --json replies.json
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from types import SimpleNamespace
+from pathlib import Path
+from discord import Embed
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# pylint: disable=wrong-import-position
+from views import guess_view
+from services.reply_service import ReplyService
+
+# pylint: enable=wrong-import-position
+
+RATE_LIMIT = 5
+RATE_LIMIT_SECONDS = 5
+
+
+class FakeChannel:
+    """Sends one message at a time, in order, at most RATE_LIMIT per period"""
+
+    def __init__(self, speed: float) -> None:
+        self.id = 1
+        self.period = RATE_LIMIT_SECONDS / speed
+        self.sent: list[float] = []
+        self._lock = asyncio.Lock()
+
+    async def send(self, **_):
+        async with self._lock:
+            if len(self.sent) >= RATE_LIMIT:
+                wait = self.sent[-RATE_LIMIT] + self.period - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            self.sent.append(time.monotonic())
+
+
+def make_messages(channel: FakeChannel, count: int) -> list:
+    rng = random.Random(0)
+    messages = []
+    for _ in range(count):
+        author = SimpleNamespace(id=rng.randint(1, 10), mention="<@0>")
+        messages.append(
+            SimpleNamespace(
+                channel=channel,
+                author=author,
+                hint=rng.random() < 0.2,
+                reply=channel.send,
+            )
+        )
+    return messages
+
+
+async def play(reply_service, messages: list, burst: float, speed: float) -> float:
+    """Seconds between the end of the game and the reveal being sent"""
+    channel = messages[0].channel
+    tasks = []
+
+    for message in messages:
+        await asyncio.sleep(burst / speed / len(messages))
+
+        if reply_service is None:
+            # Like on_message before, every message gets its own reply
+            tasks.append(asyncio.create_task(channel.send(embed=Embed())))
+        elif message.hint:
+            reply_service.hint(channel, Embed)
+        else:
+            reply_service.close_answer(message, guess_view.CloseAnswerEmbed)
+
+    ended = time.monotonic()
+    if reply_service is not None:
+        reply_service.forget(channel)
+    await channel.send(embed=Embed())
+    reveal_delay = time.monotonic() - ended
+
+    await asyncio.gather(*tasks)
+    return reveal_delay * speed
+
+
+async def measure(use_service: bool, args: argparse.Namespace) -> dict:
+    channel = FakeChannel(args.speed)
+    messages = make_messages(channel, args.messages)
+    reply_service = ReplyService(args.window / args.speed) if use_service else None
+
+    reveal_delay = await play(reply_service, messages, args.burst, args.speed)
+
+    return {
+        "replies_sent": len(channel.sent) - 1,
+        "reveal_delay_s": reveal_delay,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument(
+        "--burst", type=float, default=3, help="Seconds the messages are sent over"
+    )
+    parser.add_argument("--window", type=float, default=1.5)
+    parser.add_argument(
+        "--speed", type=float, default=10, help="Runs the simulation this much faster"
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    args = parser.parse_args()
+
+    results = {
+        "before": asyncio.run(measure(False, args)),
+        "reply_service": asyncio.run(measure(True, args)),
+    }
+
+    print(f"{args.messages} near misses and hints over {args.burst}s, then the reveal")
+    print(f"{'replies':<14} {'sent':>5} {'reveal delay':>13}")
+    for name, result in results.items():
+        print(
+            f"{name:<14} {result['replies_sent']:>5} "
+            f"{result['reveal_delay_s']:>12.2f}s"
+        )
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+"""
+Runs the hot paths of the game without Discord and writes the results as
+JSON, to compare two versions of the bot: rendering the pokemons, the
+catalog lookup, on_message, ending the games at their end time and the
+embeds.
+
+Runs in a temporary directory with generated pokemons, nothing is read from
+or written to ./pokemons. Run from the repository root:
+
+    python ./benchmarks/suite.py --json results.json
+    python ./benchmarks/suite.py --compare results.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from pathlib import Path
+from PIL import Image, ImageDraw
+import discord
+from discord.ext import commands
+
+REPOSITORY = Path(__file__).resolve().parents[1]
+
+sys.path.insert(0, str(REPOSITORY / "src"))
+
+# pylint: disable=wrong-import-position
+from models.guesser import Guesser
+from models.pokemon import Pokemon
+from views import guess_view
+from services.image_service import ImageService, BACKGROUND_PATH, get_encoding
+from services.asset_service import ORIGINAL_DIR
+from services.catalog_service import CatalogService, HIDDEN_IMG_DIR, REVEALED_IMG_DIR
+from services.guesser_service import GuesserService
+from controllers.guess_controller import GuessController, HINT_REQUEST_TEXT
+
+# pylint: enable=wrong-import-position
+
+BENCHMARKS = ("process_image", "get_pokemon_by_id", "on_message", "expiry", "embeds")
+
+WORDS = (
+    "the a is it that what who pokemon guess i think no yes maybe lol "
+    "looks like kind of sure not easy hard wait its this one again bird"
+).split()
+
+
+def percentile(values: list[float], percent: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * percent / 100), len(values) - 1)]
+
+
+def make_original(pokemon_id: int) -> Image.Image:
+    """A pokemon shaped image with transparency, the same for each id"""
+    rng = random.Random(pokemon_id)
+    img = Image.new("RGBA", (475, 475), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+
+    for _ in range(rng.randint(3, 8)):
+        x, y = rng.randint(60, 300), rng.randint(60, 300)
+        size = rng.randint(40, 160)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255)
+        draw.ellipse((x, y, x + size, y + size * rng.uniform(0.5, 1.5)), fill=color)
+
+    return img
+
+
+def bench_process_image(dex: int) -> dict:
+    """Renders the whole dex like the asset build, one image at a time"""
+    image_service = ImageService()
+    extension = get_encoding().extension
+
+    os.makedirs(ORIGINAL_DIR, exist_ok=True)
+    for pokemon_id in range(1, dex + 1):
+        make_original(pokemon_id).save(
+            Path(ORIGINAL_DIR, f"{pokemon_id}_Poke{pokemon_id}.png")
+        )
+
+    durations = []
+    start = time.perf_counter()
+    for pokemon_id in range(1, dex + 1):
+        image_start = time.perf_counter()
+        image_service.process_image(
+            Path(ORIGINAL_DIR, f"{pokemon_id}_Poke{pokemon_id}.png"),
+            Path(HIDDEN_IMG_DIR, f"{pokemon_id}_Poke{pokemon_id}{extension}"),
+            Path(REVEALED_IMG_DIR, f"{pokemon_id}_Poke{pokemon_id}{extension}"),
+        )
+        durations.append(time.perf_counter() - image_start)
+    dex_time = time.perf_counter() - start
+
+    return {
+        "images": dex,
+        "per_image_ms_median": statistics.median(durations) * 1000,
+        "per_image_ms_p95": percentile(durations, 95) * 1000,
+        "dex_seconds": dex_time,
+    }
+
+
+def bench_get_pokemon_by_id(lookups: int) -> dict:
+    """Looks up random pokemons among the rendered ones"""
+    catalog_service = CatalogService()
+    catalog_service.reload()
+    guesser_service = GuesserService(catalog_service=catalog_service)
+
+    rng = random.Random(0)
+    ids = catalog_service.get_ids()
+    durations = []
+    for _ in range(lookups):
+        pokemon_id = rng.choice(ids)
+        start = time.perf_counter()
+        guesser_service.get_pokemon_by_id(pokemon_id)
+        durations.append(time.perf_counter() - start)
+
+    return {
+        "lookups": lookups,
+        "us_median": statistics.median(durations) * 1e6,
+        "us_p99": percentile(durations, 99) * 1e6,
+    }
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int) -> None:
+        self.id = channel_id
+        self.sent = 0
+
+    async def send(self, **_):
+        self.sent += 1
+
+
+def make_message(rng: random.Random, channel: FakeChannel, name: str):
+    kind = rng.random()
+    if kind < 0.80:
+        content = " ".join(rng.choices(WORDS, k=rng.randint(1, 12)))
+    elif kind < 0.92:
+        index = rng.randrange(len(name))
+        content = name[:index] + "x" + name[index + 1 :]
+    elif kind < 0.97:
+        content = rng.choice(sorted(HINT_REQUEST_TEXT))
+    else:
+        content = name.lower()
+
+    author = SimpleNamespace(
+        id=rng.randint(1, 50),
+        bot=False,
+        mention="<@1>",
+        display_avatar=SimpleNamespace(url=""),
+    )
+    message = SimpleNamespace(channel=channel, author=author, content=content)
+    message.reply = channel.send
+    return message
+
+
+async def bench_on_message(messages: int) -> dict:
+    """Sends chat, near misses, hints and answers to the guess controller"""
+    bot = commands.AutoShardedBot(command_prefix="!", intents=discord.Intents.none())
+    controller = GuessController(bot)
+    controller.catalog_service.reload()
+
+    rng = random.Random(0)
+    channel = FakeChannel(1)
+    ids = controller.catalog_service.get_ids()
+    games = 0
+
+    elapsed = 0.0
+    for _ in range(messages):
+        guesser = controller.guesser_service.get_guesser(channel)
+
+        # A new game once the last one was won
+        if guesser is None:
+            now = datetime.utcnow()
+            guesser = Guesser(
+                channel=channel,
+                pokemon=controller.guesser_service.get_pokemon_by_id(rng.choice(ids)),
+                start_time=now,
+                end_time=now + timedelta(seconds=300),
+                custom=False,
+                author=SimpleNamespace(id=0),
+            )
+            controller.guesser_service.add_guesser(guesser)
+            games += 1
+
+        message = make_message(rng, channel, guesser.pokemon.name)
+
+        start = time.perf_counter()
+        await controller.on_message(message)
+        elapsed += time.perf_counter() - start
+
+        # The merged replies are sent by the loop
+        await asyncio.sleep(0)
+
+    controller.cog_unload()
+
+    return {
+        "messages": messages,
+        "games": games,
+        "messages_per_second": messages / elapsed,
+    }
+
+
+async def bench_expiry(guessers: int) -> dict:
+    """Starts many games ending within a second, then waits for every reveal"""
+    guesser_service = GuesserService(catalog_service=CatalogService())
+    pokemon = Pokemon(
+        id=1,
+        name="Bulbasaur",
+        hidden_img_path=None,
+        revealed_img_path=None,
+        original_img_path=None,
+    )
+
+    lateness = []
+    done = asyncio.Event()
+
+    async def on_end(guesser: Guesser):
+        lateness.append((datetime.utcnow() - guesser.end_time).total_seconds())
+        if len(lateness) == guessers:
+            done.set()
+
+    guesser_service.on_guesser_end_event.append(on_end)
+
+    rng = random.Random(0)
+    # After the games are added, adding them blocks the loop
+    end_time = datetime.utcnow() + timedelta(seconds=guessers / 20000 + 1)
+
+    start = time.perf_counter()
+    for channel_id in range(guessers):
+        guesser_service.add_guesser(
+            Guesser(
+                channel=SimpleNamespace(id=channel_id),
+                pokemon=pokemon,
+                start_time=datetime.utcnow(),
+                end_time=end_time + timedelta(seconds=rng.random()),
+                custom=False,
+                author=SimpleNamespace(id=0),
+            )
+        )
+    add_time = time.perf_counter() - start
+
+    await done.wait()
+
+    return {
+        "guessers": guessers,
+        "add_us": add_time / guessers * 1e6,
+        "lateness_ms_median": statistics.median(lateness) * 1000,
+        "lateness_ms_max": max(lateness) * 1000,
+    }
+
+
+def bench_embeds(iterations: int) -> dict:
+    """Microseconds to build each embed of a game"""
+    now = datetime.utcnow()
+    winner = SimpleNamespace(
+        id=1, mention="<@1>", display_name="Ash", display_avatar=SimpleNamespace(url="")
+    )
+
+    def make_guesser(pokemon_id: int) -> Guesser:
+        guesser = Guesser(
+            channel=SimpleNamespace(id=1),
+            pokemon=Pokemon(
+                id=pokemon_id,
+                name="Crabominable",
+                hidden_img_path=None,
+                revealed_img_path=None,
+                original_img_path=None,
+            ),
+            start_time=now,
+            end_time=now + timedelta(seconds=60),
+            custom=False,
+            author=winner,
+            total_guesses=12,
+        )
+        guesser.winner = winner
+        guesser.hints_given = 2
+        return guesser
+
+    guesser = make_guesser(740)
+    # Corrupted text easter egg
+    missingno = make_guesser(0)
+    file = discord.File(io.BytesIO(b""), filename="image.png")
+    players = [winner] * 3
+
+    embeds = {
+        "HiddenEmbed": lambda: guess_view.HiddenEmbed(guesser, file),
+        "RevealedEmbed": lambda: guess_view.RevealedEmbed(guesser, file),
+        "RevealedEmbed_missingno": lambda: guess_view.RevealedEmbed(missingno, file),
+        "HintEmbed": lambda: guess_view.HintEmbed(guesser),
+        "CloseAnswerEmbed": lambda: guess_view.CloseAnswerEmbed(players),
+    }
+
+    results = {}
+    for name, make_embed in embeds.items():
+        start = time.perf_counter()
+        for _ in range(iterations):
+            make_embed()
+        results[f"{name}_us"] = (time.perf_counter() - start) / iterations * 1e6
+
+    return results
+
+
+def get_version() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPOSITORY,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.utcnow().isoformat(),
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.makedirs(Path(directory, BACKGROUND_PATH.parent))
+        shutil.copy(REPOSITORY / BACKGROUND_PATH, Path(directory, BACKGROUND_PATH))
+
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            # The other benchmarks play with these rendered pokemons
+            results["process_image"] = bench_process_image(args.dex)
+
+            if "get_pokemon_by_id" in args.only:
+                results["get_pokemon_by_id"] = bench_get_pokemon_by_id(args.lookups)
+            if "on_message" in args.only:
+                results["on_message"] = asyncio.run(bench_on_message(args.messages))
+            if "expiry" in args.only:
+                results["expiry"] = asyncio.run(bench_expiry(args.guessers))
+            if "embeds" in args.only:
+                results["embeds"] = bench_embeds(args.iterations)
+        finally:
+            os.chdir(cwd)
+
+    if "process_image" not in args.only:
+        del results["process_image"]
+
+    return results
+
+
+def is_better_higher(metric: str) -> bool:
+    return metric.endswith("_per_second")
+
+
+def compare(previous: dict, current: dict, tolerance: float):
+    """Prints the change of every timing measured by both runs"""
+    print(
+        f"\nCompared to {previous['version']['commit']} ({previous['version']['date']})"
+    )
+    print(f"{'metric':<45} {'before':>12} {'after':>12} {'change':>8}")
+
+    for benchmark, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            before = previous["results"].get(benchmark, {}).get(metric)
+
+            # Counts are the same in both runs, not timings
+            if before is None or not isinstance(value, float) or before == 0:
+                continue
+
+            change = (value - before) / before
+            if is_better_higher(metric):
+                change = -change
+
+            verdict = ""
+            if change > tolerance:
+                verdict = "slower"
+            elif change < -tolerance:
+                verdict = "faster"
+
+            print(
+                f"{benchmark + '.' + metric:<45} {before:>12.3f} {value:>12.3f} "
+                f"{change * 100:>+7.1f}% {verdict}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=BENCHMARKS,
+        default=list(BENCHMARKS),
+        help="Benchmarks to run, the pokemons are rendered for all of them",
+    )
+    parser.add_argument("--dex", type=int, default=905, help="Pokemons to render")
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--guessers", type=int, default=20000)
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--json", type=Path, help="Also write the results here")
+    parser.add_argument("--compare", type=Path, help="Results of a previous run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Changes under this ratio are noise, not slower or faster",
+    )
+    args = parser.parse_args()
+
+    current = {"version": get_version(), "results": run(args)}
+
+    for benchmark, metrics in current["results"].items():
+        print(benchmark)
+        for metric, value in metrics.items():
+            print(f"    {metric:<30} {value:>14.3f}")
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), current, args.tolerance)
+
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
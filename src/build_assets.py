@@ -0,0 +1,61 @@
+"""
+Downloads and renders every pokemon image without starting the bot.
+
+Can be stopped at any time, the next run resumes where it left off.
+
+    python ./src/build_assets.py --jobs 4
+"""
+
+import argparse
+import logging
+import sys
+from services.pokedex_service import PokedexService
+from services.asset_service import AssetService
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+    format="%(asctime)s %(levelname)-7s %(name)-25s %(message)s",
+)
+log = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the pokemon image assets")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Number of rendering processes, defaults to the CPU count",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Check the pokedex for new or changed pokemons",
+    )
+    parser.add_argument(
+        "--skip-download",
+        action="store_true",
+        help="Only render the images that are already downloaded",
+    )
+    args = parser.parse_args()
+
+    log.info("Verifying pokemon images")
+    AssetService(jobs=args.jobs).verify()
+
+    if not args.skip_download:
+        log.info("Downloading pokemon images")
+        PokedexService().download_all_pokemon(refresh=args.refresh)
+
+    log.info("Processing pokemon images")
+    AssetService(jobs=args.jobs).build()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        log.warning("Interrupted, run again to resume")
+        sys.exit(130)
@@ -0,0 +1,319 @@
+"""
+Runs the bot in several processes, each one connects a part of the shards
+and runs its own games. The images are prepared once, here, and shared by
+every process.
+
+Process N serves its metrics on --metrics-port + N and its health on
+--health-port + N. Linux only, the processes are signaled when the images
+are ready.
+
+    python ./src/cluster.py --processes 4
+    python ./src/cluster.py --processes 2 --stub-gateway
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import logging
+import argparse
+import threading
+import subprocess
+import urllib.request
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Optional
+import requests
+from dotenv import load_dotenv
+from services.pokedex_service import PokedexService
+from services.asset_service import AssetService
+from services.journal_service import get_shard_id, replay, write_journal
+
+logging.basicConfig(
+    stream=sys.stdout,
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+    format="%(asctime)s %(levelname)-7s [cluster] %(name)-25s %(message)s",
+)
+log = logging.getLogger(__name__)
+
+MAIN_PATH = Path(__file__).resolve().parent / "main.py"
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+
+# Seconds before a crashed process is started again
+RESTART_DELAY = 5
+# Seconds given to the processes to save their games when stopping
+STOP_TIMEOUT = 30
+
+# Journals of the processes, and of the bot started without the launcher
+JOURNAL_DIR = Path("./pokemons")
+JOURNAL_PATTERN = re.compile(r"games(\.\d+)?\.journal")
+STUB_JOURNAL_PATTERN = re.compile(r"games\.stub-\d+\.journal")
+
+
+@dataclass
+class Worker:
+    cluster_id: int
+    shard_ids: list[int]
+    env: dict[str, str]
+    health_port: int
+    process: Optional[subprocess.Popen] = None
+    # Told that the images are ready
+    notified: bool = False
+    exited_at: Optional[float] = None
+
+    def start(self):
+        log.info(f"Starting process {self.cluster_id} with shards {self.shard_ids}")
+        self.process = subprocess.Popen([sys.executable, str(MAIN_PATH)], env=self.env)
+        self.notified = False
+        self.exited_at = None
+
+    def is_up(self) -> bool:
+        """If the process answers on its health endpoint"""
+        try:
+            with urllib.request.urlopen(
+                f"http://127.0.0.1:{self.health_port}/health", timeout=1
+            ):
+                return True
+        except OSError:
+            return False
+
+
+def get_recommended_shards() -> int:
+    response = requests.get(
+        GATEWAY_URL,
+        headers={"Authorization": f"Bot {os.environ['DISCORD_BOT_TOKEN']}"},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()["shards"]
+
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """Consecutive shard ids for each process, as even as possible"""
+    size, extra = divmod(shard_count, processes)
+
+    groups = []
+    start = 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(list(range(start, end)))
+        start = end
+
+    return groups
+
+
+class Cluster:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.workers: list[Worker] = []
+
+        self.assets_ready = False
+        self.stopping = False
+
+    def make_workers(self, shard_count: int):
+        groups = split_shards(shard_count, min(self.args.processes, shard_count))
+
+        for cluster_id, shard_ids in enumerate(groups):
+            env = {
+                **os.environ,
+                "CLUSTER_ID": str(cluster_id),
+                "CLUSTER_SHARD_IDS": ",".join(str(i) for i in shard_ids),
+                "SHARD_COUNT": str(shard_count),
+                "METRICS_PORT": str(self.args.metrics_port + cluster_id),
+                "HEALTH_PORT": str(self.args.health_port + cluster_id),
+                # Each process keeps its own games and renders
+                "JOURNAL_PATH": str(Path(JOURNAL_DIR, f"games.{cluster_id}.journal")),
+                "RENDER_CACHE_DIR": f"./pokemons/custom_cache/{cluster_id}/",
+                "PREPARE_ASSETS": "false",
+                "STUB_GATEWAY": "true" if self.args.stub_gateway else "false",
+            }
+
+            # Local runs must not replace the games of the real bot
+            if self.args.stub_gateway:
+                env["JOURNAL_PATH"] = str(
+                    Path(JOURNAL_DIR, f"games.stub-{cluster_id}.journal")
+                )
+
+            self.workers.append(
+                Worker(
+                    cluster_id=cluster_id,
+                    shard_ids=shard_ids,
+                    env=env,
+                    health_port=self.args.health_port + cluster_id,
+                )
+            )
+
+    def split_journals(self, shard_count: int):
+        """
+        Moves the unfinished games to the journal of the process running their
+        shard, the shards of a process change with the number of processes and
+        of shards. Done before the processes start, they only resume the games
+        of their own shards.
+        """
+        pattern = STUB_JOURNAL_PATTERN if self.args.stub_gateway else JOURNAL_PATTERN
+        if not JOURNAL_DIR.exists():
+            return
+
+        sources = sorted(
+            path for path in JOURNAL_DIR.iterdir() if pattern.fullmatch(path.name)
+        )
+        if len(sources) == 0:
+            return
+
+        # Journal of each unfinished game, by channel_id
+        games: dict[int, dict] = {}
+        origins: dict[int, Path] = {}
+        for path in sources:
+            for channel_id, record in replay(path)[0].items():
+                games[channel_id] = record
+                origins[channel_id] = path
+
+        moved = 0
+        targets = set()
+        for worker in self.workers:
+            path = Path(worker.env["JOURNAL_PATH"])
+            targets.add(path)
+
+            records = [
+                record
+                for record in games.values()
+                if get_shard_id(record.get("guild"), shard_count) in worker.shard_ids
+            ]
+            moved += sum(1 for record in records if origins[record["channel"]] != path)
+
+            write_journal(
+                path, "".join(json.dumps(record) + "\n" for record in records)
+            )
+
+        # Journals of the processes that are not started anymore
+        for path in sources:
+            if path not in targets:
+                log.info(f"Removing {path}, its games were moved")
+                path.unlink()
+
+        log.info(
+            f"Split {len(games)} unfinished games of {len(sources)} journals, "
+            f"{moved} moved to another process"
+        )
+
+    def prepare_pokemon_images(self):
+        try:
+            log.info("Verifying pokemon images")
+            AssetService().verify()
+
+            log.info("Downloading pokemon images")
+            PokedexService().download_all_pokemon(
+                refresh=os.getenv("POKEDEX_REFRESH", "false") == "true"
+            )
+
+            log.info("Processing pokemon images")
+            AssetService().build()
+        except Exception:
+            log.exception("Could not prepare the pokemon images")
+            return
+
+        self.assets_ready = True
+
+    def stop(self, *_):
+        if self.stopping:
+            return
+
+        log.info("Stopping the processes")
+        self.stopping = True
+
+        for worker in self.workers:
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.terminate()
+
+    def supervise(self):
+        """Restarts the crashed processes and tells them when the images are ready"""
+        for worker in self.workers:
+            if worker.process.poll() is not None:
+                if worker.exited_at is None:
+                    log.error(
+                        f"Process {worker.cluster_id} exited with code "
+                        f"{worker.process.returncode}, restarting it in {RESTART_DELAY}s"
+                    )
+                    worker.exited_at = time.monotonic()
+                elif time.monotonic() - worker.exited_at >= RESTART_DELAY:
+                    worker.start()
+                continue
+
+            # The signal would kill the process before it set up its handler
+            if self.assets_ready and not worker.notified and worker.is_up():
+                log.info(
+                    f"Telling process {worker.cluster_id} that the images are ready"
+                )
+                worker.process.send_signal(signal.SIGUSR1)
+                worker.notified = True
+
+    def run(self):
+        if self.args.shards is not None:
+            shard_count = self.args.shards
+        elif os.getenv("SHARD_COUNT"):
+            shard_count = int(os.environ["SHARD_COUNT"])
+        elif self.args.stub_gateway:
+            shard_count = self.args.processes
+        else:
+            shard_count = get_recommended_shards()
+            log.info(f"Discord recommends {shard_count} shards")
+
+        self.make_workers(shard_count)
+        self.split_journals(shard_count)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for worker in self.workers:
+            worker.start()
+
+        # The bots connect right away, the images are prepared meanwhile
+        threading.Thread(target=self.prepare_pokemon_images, daemon=True).start()
+
+        while not self.stopping:
+            self.supervise()
+            time.sleep(1)
+
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for worker in self.workers:
+            try:
+                worker.process.wait(timeout=max(deadline - time.monotonic(), 0))
+            except subprocess.TimeoutExpired:
+                log.warning(f"Process {worker.cluster_id} did not stop, killing it")
+                worker.process.kill()
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Run the bot in several processes")
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of bot processes, defaults to the CPU count",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="Total number of shards, defaults to SHARD_COUNT or the Discord recommendation",
+    )
+    parser.add_argument("--metrics-port", type=int, default=8000)
+    parser.add_argument("--health-port", type=int, default=8100)
+    parser.add_argument(
+        "--stub-gateway",
+        action="store_true",
+        help="Do not connect to Discord, to try the cluster locally",
+    )
+    args = parser.parse_args()
+
+    Cluster(args).run()
+
+
+if __name__ == "__main__":
+    main()
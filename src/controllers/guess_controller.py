@@ -1,33 +1,85 @@
-import os
 from datetime import datetime, timedelta
+import os
 import random
-from pathlib import Path
+import io
+import time
+import asyncio
 import logging
-import tempfile
-import uuid
+from typing import Optional
 from discord.ext import commands
 from discord import app_commands, Interaction, File, Message
 from discord.app_commands import Choice, Range
 import discord
-import Levenshtein
 from models.guesser import Guesser
 from models.pokemon import Pokemon
 from views import guess_view
 from services.guesser_service import GuesserService, GuesserAlreadyActiveException
-from services.image_service import ImageService
-from prometheus_client import Counter
+from services.catalog_service import (
+    CatalogService,
+    HIDDEN_IMG_DIR,
+    REVEALED_IMG_DIR,
+    make_pokemon,
+)
+from services.journal_service import JournalService, get_shard_id
+from services.answer_service import Match
+from services.image_cache_service import ImageCacheService, HIDDEN, REVEALED
+from services.archive_service import ArchiveService
+from services.image_service import (
+    get_encoding,
+    InvalidImageException,
+    ImageTooLargeException,
+)
+from services.render_service import RenderService, RenderQueueFullException
+from services.render_cache_service import RenderCacheService
+from services.reply_service import ReplyService
+from prometheus_client import Counter, Histogram
 
 log = logging.getLogger(__name__.removesuffix("_controller"))
 
-ORIGINAL_DIR_TMP = Path(tempfile.gettempdir(), "custompokemon", "originals")
-REVEALED_DIR_TMP = Path(tempfile.gettempdir(), "custompokemon", "revealed")
-HIDDEN_DIR_TMP = Path(tempfile.gettempdir(), "custompokemon", "hidden")
-
 POKEGUESS_ATTEMPS_COUNTER = Counter(
     "pokeguess_guess_attemps", "How many attemps were made by users"
 )
 POKEGUESS_HINTS_COUNTER = Counter("pokeguess_guess_hints", "How many hints were given")
 
+# Latency of each stage of a game, by command and custom game
+STAGE_LABELS = ["command", "custom"]
+POKEGUESS_CATALOG_LOOKUP_HISTOGRAM = Histogram(
+    "pokeguess_catalog_lookup_seconds",
+    "Time to pick the pokemon of a game",
+    STAGE_LABELS,
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05),
+)
+POKEGUESS_RENDER_HISTOGRAM = Histogram(
+    "pokeguess_render_seconds",
+    "Time to render a custom image, with the queue wait and the render cache",
+    STAGE_LABELS,
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+POKEGUESS_IMAGE_READ_HISTOGRAM = Histogram(
+    "pokeguess_image_read_seconds",
+    "Time to read the image of a game, the uploaded attachment of custom games",
+    STAGE_LABELS,
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5),
+)
+POKEGUESS_SEND_HISTOGRAM = Histogram(
+    "pokeguess_send_message_seconds",
+    "Time to send the hidden pokemon",
+    STAGE_LABELS,
+)
+POKEGUESS_REVEAL_SEND_HISTOGRAM = Histogram(
+    "pokeguess_reveal_send_seconds",
+    "Time to send the revealed pokemon",
+    STAGE_LABELS,
+)
+POKEGUESS_REVEAL_DELAY_HISTOGRAM = Histogram(
+    "pokeguess_reveal_delay_seconds",
+    "Time between the end time of a game nobody won and the sending of its reveal",
+    STAGE_LABELS,
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+POKEGUESS_LABELS = ("pokeguess", "false")
+CUSTOM_LABELS = ("pokeguesscustom", "true")
+
 ALLOWED_CONTENT_TYPE = ["image/png"]
 HINT_REQUEST_TEXT = {
     "hint",
@@ -59,14 +111,54 @@ HINT_REQUEST_TEXT = {
     "help please",
 }
 
+# How the players answer: by sending messages, or with the /guess command and
+# the buttons of the hidden pokemon, which do not need the message content
+GUESS_MODES = ("message", "command")
+
+
+def get_guess_mode() -> str:
+    """The guess mode, from the GUESS_MODE environment variable"""
+    mode = os.getenv("GUESS_MODE", "message")
+
+    if mode not in GUESS_MODES:
+        raise ValueError(
+            f"Unknown guess mode '{mode}', use one of {', '.join(GUESS_MODES)}"
+        )
+
+    return mode
+
 
 class GuessController(commands.Cog):
     """Handles request related to the pokeguess command."""
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.guesser_service = GuesserService()
-        self.image_service = ImageService()
+        self.archive_service = ArchiveService()
+        self.catalog_service = CatalogService(archive_service=self.archive_service)
+        self.journal_service = JournalService()
+        self.guesser_service = GuesserService(
+            catalog_service=self.catalog_service, journal_service=self.journal_service
+        )
+        self.render_service = RenderService(render_cache_service=RenderCacheService())
+        self.image_cache_service = ImageCacheService(
+            archive_service=self.archive_service
+        )
+        self.reply_service = ReplyService()
+
+        self.preload_image_cache = os.getenv("IMAGE_CACHE_PRELOAD", "false") == "true"
+
+        self.guess_mode = get_guess_mode()
+        if self.guess_mode == "command":
+            # the buttons of the games sent before a restart
+            bot.add_view(self.make_guess_view())
+
+        # the images are prepared in the background, see main.prepare_pokemon_images
+        self.assets_ready = False
+
+        # the games of the previous run are resumed once, on the first connection
+        self.games_restored = False
+        # the games that ended before, while the bot was offline, are not in the reveal delay
+        self.started_at = datetime.utcnow()
 
         # register the on_guess_end method to be called
         self.guesser_service.on_guesser_end_event.append(self.on_guess_end)
@@ -74,6 +166,88 @@ class GuessController(commands.Cog):
         # keep track of wich channel is processing an image, prevents duplicated requests
         self.image_being_processed: set[int] = set()
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # the images of the previous run can be played while they are prepared
+        if not self.archive_service.loaded:
+            self.archive_service.load()
+            self.catalog_service.reload()
+
+        if not self.games_restored:
+            self.games_restored = True
+            self.restore_guessers()
+
+    def cog_unload(self):
+        self.journal_service.close()
+        self.render_service.shutdown()
+
+    def restore_guessers(self):
+        """Resumes the games of the previous run, the expired ones end right away"""
+        now = datetime.utcnow()
+        restored = 0
+        expired = 0
+        kept = 0
+
+        for record in self.journal_service.load():
+            # Another process runs the channel, moved by the cluster launcher
+            if not self.owns_shard_of(record.get("guild")):
+                self.journal_service.keep(record)
+                kept += 1
+                continue
+
+            channel = self.bot.get_channel(record["channel"])
+            if channel is None:
+                log.warning(f"Channel {record['channel']} is gone, dropping its game")
+                continue
+
+            pokemon = self.catalog_service.get_pokemon(record["pokemon"])
+            if pokemon is None:
+                pokemon = make_pokemon(record["file"])
+
+            guesser = Guesser(
+                channel=channel,
+                pokemon=pokemon,
+                start_time=record["start"],
+                end_time=record["end"],
+                custom=False,
+                author=discord.Object(record["author"]),
+                total_guesses=record["guesses"],
+            )
+            guesser.hints_given = record["hints"]
+
+            self.guesser_service.add_guesser(guesser, restored=True)
+
+            restored += 1
+            if guesser.end_time < now:
+                expired += 1
+
+        log.info(
+            f"Restored {restored} games, {expired} expired while offline, "
+            f"kept {kept} games of the shards of other processes"
+        )
+
+    def owns_shard_of(self, guild_id: Optional[int]) -> bool:
+        """If the guild is in the shards of this process, None for private messages"""
+        if self.bot.shard_ids is None:
+            return True
+
+        return get_shard_id(guild_id, self.bot.shard_count) in self.bot.shard_ids
+
+    @commands.Cog.listener()
+    async def on_assets_ready(self):
+        # the archive was packed again, the cached images may be outdated
+        self.archive_service.load()
+        self.catalog_service.reload()
+        self.image_cache_service.clear()
+        self.assets_ready = True
+
+        log.info(f"{len(self.catalog_service)} pokemons are ready")
+
+        if self.preload_image_cache:
+            await asyncio.to_thread(
+                self.image_cache_service.preload, HIDDEN_IMG_DIR, REVEALED_IMG_DIR
+            )
+
     @app_commands.command(
         name="pokeguesscustom", description="Start a Pokemon guess with a custom image"
     )
@@ -141,29 +315,63 @@ class GuessController(commands.Cog):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        # Create the file path
-        file_extension = image.filename.split(".")[-1]
-        file_name = f"{uuid.uuid4()}.{file_extension}"
-        file_path = Path(ORIGINAL_DIR_TMP, file_name)
-        hidden_file_path = Path(HIDDEN_DIR_TMP, file_name)
-        revealed_file_path = Path(REVEALED_DIR_TMP, file_name)
+        # Refuse huge images before downloading them
+        if self.render_service.is_too_large(image.size, image.width, image.height):
+            log.warning(f"Image too large, {image.width}x{image.height} {image.size}")
+            log.info("Sending ImageTooLargeEmbed")
+            embed = guess_view.ImageTooLargeEmbed()
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
 
-        # Saving this file
-        log.info(f"Saving {file_path}")
-        os.makedirs(ORIGINAL_DIR_TMP, exist_ok=True)
-        await image.save(file_path)
+        # Are the render workers overloaded?
+        if self.render_service.is_full():
+            log.warning(
+                f"Render queue is full, {self.render_service.pending} images pending"
+            )
+            log.info("Sending ProcessingBusyEmbed")
+            embed = guess_view.ProcessingBusyEmbed()
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
 
         # Starting the process
         try:
             self.image_being_processed.add(interaction.channel.id)
-            self.image_service.process_image(
-                file_path, hidden_file_path, revealed_file_path
-            )
+
+            # Processing can take a while, let discord know we are working on it.
+            # Only the author sees it, with the errors, the pokemon is sent in
+            # the channel
+            await interaction.response.defer(ephemeral=True, thinking=True)
+
+            # Everything stays in memory, nothing is written to the disk
+            log.info(f"Reading {image.filename}")
+            with POKEGUESS_IMAGE_READ_HISTOGRAM.labels(*CUSTOM_LABELS).time():
+                original = await image.read()
+
+            with POKEGUESS_RENDER_HISTOGRAM.labels(*CUSTOM_LABELS).time():
+                hidden, revealed = await self.render_service.process_image(original)
+        except ImageTooLargeException as e:
+            log.warning(f"Image too large, {e}")
+            log.info("Sending ImageTooLargeEmbed")
+            embed = guess_view.ImageTooLargeEmbed()
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
+        except InvalidImageException as e:
+            log.warning(f"Invalid image, {e}")
+            log.info("Sending InvalidMediaTypeEmbed")
+            embed = guess_view.InvalidMediaTypeEmbed()
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
+        except RenderQueueFullException:
+            log.warning("Render queue filled up while saving the image")
+            log.info("Sending ProcessingBusyEmbed")
+            embed = guess_view.ProcessingBusyEmbed()
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            return
         except:
             log.exception("Image processing failed")
             log.info("Sending ProcessingFailedEmbed")
             embed = guess_view.ProcessingFailedEmbed()
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            await interaction.followup.send(embed=embed, ephemeral=True)
             return
         finally:
             if interaction.channel.id in self.image_being_processed:
@@ -173,9 +381,11 @@ class GuessController(commands.Cog):
         pokemon = Pokemon(
             id=None,
             name=name,
-            hidden_img_path=hidden_file_path,
-            revealed_img_path=revealed_file_path,
-            original_img_path=file_path,
+            hidden_img_path=None,
+            revealed_img_path=None,
+            original_img_path=None,
+            hidden_img=hidden,
+            revealed_img=revealed,
         )
 
         # Create the guesser
@@ -198,14 +408,20 @@ class GuessController(commands.Cog):
             )
             log.info("Sending AlreadyActiveEmbed")
             embed = guess_view.AlreadyActiveEmbed()
-            await interaction.response.send_message(embed=embed, ephemeral=True)
+            await interaction.followup.send(embed=embed, ephemeral=True)
             return
 
         # Send response
-        file = File(pokemon.hidden_img_path, filename="hidden.png")
+        file = File(
+            io.BytesIO(pokemon.hidden_img),
+            filename="hidden" + get_encoding().extension,
+        )
         log.info("Sending HiddenEmbed")
         embed = guess_view.HiddenEmbed(guesser, file)
-        await interaction.response.send_message(embed=embed, file=file)
+        with POKEGUESS_SEND_HISTOGRAM.labels(*CUSTOM_LABELS).time():
+            await interaction.channel.send(embed=embed, file=file, **self.get_buttons())
+
+        await interaction.delete_original_response()
 
     @app_commands.command(
         name="pokeguess",
@@ -271,34 +487,34 @@ class GuessController(commands.Cog):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
 
-        id_range = (0, 905)
-
         if generation is None:
             generation = Choice(name="All", value=0)
 
-        if generation.value == 0:  # all
-            id_range = (0, 905)
-        elif generation.value == 1:
-            id_range = (0, 151)
-        elif generation.value == 2:
-            id_range = (152, 251)
-        elif generation.value == 3:
-            id_range = (252, 386)
-        elif generation.value == 4:
-            id_range = (387, 493)
-        elif generation.value == 5:
-            id_range = (494, 649)
-        elif generation.value == 6:
-            id_range = (650, 721)
-        elif generation.value == 7:
-            id_range = (722, 809)
-        elif generation.value == 8:
-            id_range = (810, 905)
-
-        choice = random.randint(*id_range)
+        lookup_start = time.perf_counter()
+
+        # only the pokemons with their images ready
+        choices = self.catalog_service.get_ids(generation.value)
+
+        if len(choices) == 0:
+            if not self.assets_ready:
+                log.warning("No pokemon ready yet, still preparing the images")
+                log.info("Sending WarmingUpEmbed")
+                embed = guess_view.WarmingUpEmbed()
+            else:
+                log.error(f"No pokemon available in {generation.name}")
+                log.info("Sending GenericErrorEmbed")
+                embed = guess_view.GenericErrorEmbed()
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        choice = random.choice(choices)
 
         pokemon = self.guesser_service.get_pokemon_by_id(choice)
 
+        POKEGUESS_CATALOG_LOOKUP_HISTOGRAM.labels(*POKEGUESS_LABELS).observe(
+            time.perf_counter() - lookup_start
+        )
+
         # Create Guesser
         now = datetime.utcnow()
 
@@ -314,70 +530,190 @@ class GuessController(commands.Cog):
         self.guesser_service.add_guesser(guesser)
 
         # Send response
-        file = File(pokemon.hidden_img_path, filename="hidden.png")
+        with POKEGUESS_IMAGE_READ_HISTOGRAM.labels(*POKEGUESS_LABELS).time():
+            hidden_img = self.image_cache_service.get_image(
+                pokemon.id, HIDDEN, pokemon.hidden_img_path
+            )
+        file = File(
+            io.BytesIO(hidden_img),
+            filename="hidden" + pokemon.hidden_img_path.suffix,
+        )
         log.info("Sending HiddenEmbed")
         embed = guess_view.HiddenEmbed(guesser, file)
-        await interaction.response.send_message(embed=embed, file=file)
+        with POKEGUESS_SEND_HISTOGRAM.labels(*POKEGUESS_LABELS).time():
+            await interaction.response.send_message(
+                embed=embed, file=file, **self.get_buttons()
+            )
+
+    def make_guess_view(self) -> guess_view.GuessView:
+        return guess_view.GuessView(self.on_guess_interaction, self.on_hint_interaction)
+
+    def get_buttons(self) -> dict:
+        """The guess buttons sent with the hidden pokemon, in the command mode"""
+        if self.guess_mode != "command":
+            return {}
+
+        return {"view": self.make_guess_view()}
+
+    def count_guess(self, guesser: Guesser, text: str) -> Match:
+        guesser.total_guesses += 1
+        POKEGUESS_ATTEMPS_COUNTER.inc()
+
+        return self.guesser_service.match_answer(guesser, text)
+
+    def make_hint(self, guesser: Guesser, user: discord.abc.User) -> discord.Embed:
+        POKEGUESS_HINTS_COUNTER.inc()
+        log.info(
+            f"User {user.id} requested a hint, hints given: {guesser.hints_given + 1}"
+        )
+        embed = guess_view.HintEmbed(guesser)
+        self.guesser_service.add_hint(guesser)
+        return embed
+
+    def get_open_guesser(self, interaction: Interaction) -> Optional[Guesser]:
+        """The game of the channel, unless it was just won"""
+        guesser = self.guesser_service.get_guesser(interaction.channel)
+
+        if guesser is None or guesser.winner is not None:
+            return None
+
+        return guesser
+
+    @app_commands.command(name="guess", description="Guess the hidden Pokemon")
+    @app_commands.describe(answer="Name of the Pokemon, or hint")
+    async def guess_command(
+        self, interaction: Interaction, answer: Range[str, 1, 100]
+    ) -> None:
+        log.info("Interaction: guess")
+        await self.on_guess_interaction(interaction, answer)
+
+    async def on_guess_interaction(self, interaction: Interaction, answer: str):
+        """Answers from the /guess command and the guess button"""
+        guesser = self.get_open_guesser(interaction)
+
+        if guesser is None:
+            log.info("Sending NoActiveGuessEmbed")
+            embed = guess_view.NoActiveGuessEmbed()
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        match = self.count_guess(guesser, answer)
+
+        if match is Match.EXACT:
+            # taken before the first await, a second right answer finds no game
+            guesser.winner = interaction.user
+
+            log.info("Sending CorrectAnswerEmbed")
+            embed = guess_view.CorrectAnswerEmbed()
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+
+            # unless it just ended with its timer
+            if self.guesser_service.get_guesser(interaction.channel) is guesser:
+                await self.guesser_service.end_guesser(interaction.channel)
+            return
+
+        if answer.strip().lower() in HINT_REQUEST_TEXT:
+            await self.on_hint_interaction(interaction)
+            return
+
+        if match is Match.CLOSE:
+            log.info(f"User {interaction.user.id} almost got it")
+            log.info("Sending CloseAnswerEmbed")
+            embed = guess_view.CloseAnswerEmbed()
+        else:
+            log.info("Sending WrongAnswerEmbed")
+            embed = guess_view.WrongAnswerEmbed()
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    async def on_hint_interaction(self, interaction: Interaction):
+        guesser = self.get_open_guesser(interaction)
+
+        if guesser is None:
+            log.info("Sending NoActiveGuessEmbed")
+            embed = guess_view.NoActiveGuessEmbed()
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return
+
+        # everyone sees the hint, like the hints asked in a message
+        embed = self.make_hint(guesser, interaction.user)
+        log.info("Sending HintEmbed")
+        await interaction.response.send_message(embed=embed)
 
     @commands.Cog.listener()
     async def on_message(self, message: Message):
+        # the messages are not read in the command mode
+        if self.guess_mode != "message":
+            return
+
         # bot filter
         if message.author.bot is True:
             return
 
         guesser = self.guesser_service.get_guesser(message.channel)
 
-        # if none, than there is no active guesser for this channel
-        if guesser is None:
+        # if none, than there is no active guesser for this channel,
+        # or it was just won with the /guess command
+        if guesser is None or guesser.winner is not None:
             return
 
-        guesser.total_guesses += 1
-        POKEGUESS_ATTEMPS_COUNTER.inc()
-
-        content = message.content.strip().lower()
+        match = self.count_guess(guesser, message.content)
 
         # if guess is right
-        if content == guesser.pokemon.name.lower():
+        if match is Match.EXACT:
             guesser.winner = message.author
             await self.guesser_service.end_guesser(message.channel)
             return
 
-        # Send a hint if the user is requesting it
-        if content in HINT_REQUEST_TEXT:
-            POKEGUESS_HINTS_COUNTER.inc()
-            log.info(
-                f"User {message.author.id} requested a hint, hints given: {guesser.hints_given + 1}"
+        # Send a hint if the user is requesting it, once for the requests
+        # made in the same window
+        if message.content.strip().lower() in HINT_REQUEST_TEXT:
+            self.reply_service.hint(
+                message.channel, lambda: self.make_hint(guesser, message.author)
             )
-            log.info("Sending HintEmbed")
-            embed = guess_view.HintEmbed(guesser)
-            await message.channel.send(embed=embed)
-            guesser.hints_given += 1
             return
 
         # The user is very close to the answer
-        if Levenshtein.distance(content, guesser.pokemon.name.lower()) == 1:
+        if match is Match.CLOSE:
             log.info(f"User {message.author.id} almost got it")
-            log.info("Sending CloseAnswerEmbed")
-            embed = guess_view.CloseAnswerEmbed()
-            await message.reply(embed=embed)
+            self.reply_service.close_answer(message, guess_view.CloseAnswerEmbed)
             return
 
     async def on_guess_end(self, guesser: Guesser):
+        # the reveal is not sent behind the replies to the guesses
+        self.reply_service.forget(guesser.channel)
+
         try:
-            file = File(guesser.pokemon.revealed_img_path)
+            if guesser.pokemon.revealed_img is not None:
+                file = File(
+                    io.BytesIO(guesser.pokemon.revealed_img),
+                    filename="revealed" + get_encoding().extension,
+                )
+            else:
+                revealed_img = self.image_cache_service.get_image(
+                    guesser.pokemon.id, REVEALED, guesser.pokemon.revealed_img_path
+                )
+                file = File(
+                    io.BytesIO(revealed_img),
+                    filename=guesser.pokemon.revealed_img_path.name,
+                )
             log.info("Sending RevealedEmbed")
             embed = guess_view.RevealedEmbed(guesser, file)
-            await guesser.channel.send(embed=embed, file=file)
+            labels = CUSTOM_LABELS if guesser.custom else POKEGUESS_LABELS
 
-            # Clean up custom pokemon
-            if guesser.custom:
-                log.info("Removing custom Pokemon")
-                try:
-                    os.remove(guesser.pokemon.hidden_img_path)
-                    os.remove(guesser.pokemon.revealed_img_path)
-                    os.remove(guesser.pokemon.original_img_path)
-                except OSError as e:
-                    log.exception("Could not remove custom pokemon")
+            if guesser.winner is None and guesser.end_time >= self.started_at:
+                POKEGUESS_REVEAL_DELAY_HISTOGRAM.labels(*labels).observe(
+                    max((datetime.utcnow() - guesser.end_time).total_seconds(), 0)
+                )
+
+            with POKEGUESS_REVEAL_SEND_HISTOGRAM.labels(*labels).time():
+                await guesser.channel.send(embed=embed, file=file)
 
         except discord.errors.NotFound:
             log.warning(f"The channel {guesser.channel.id} could not be found")
+
+        finally:
+            # Clean up custom pokemon
+            if guesser.custom:
+                log.info("Releasing custom Pokemon images")
+                guesser.pokemon.hidden_img = None
+                guesser.pokemon.revealed_img = None
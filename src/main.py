@@ -2,69 +2,216 @@ import logging
 import asyncio
 import os
 import sys
-from pathlib import Path
+import time
+import signal
+from typing import Optional
 from discord.ext import commands
-from discord import Intents, Interaction, InteractionType
+from discord import Intents, Interaction, InteractionType, ClientUser, MemberCacheFlags
 from discord.ext.prometheus import PrometheusCog, PrometheusLoggingHandler
+from prometheus_client import Gauge
 from dotenv import load_dotenv
 import controllers
+from controllers.guess_controller import get_guess_mode
 from services.pokedex_service import PokedexService
-from services.image_service import ImageService
+from services.asset_service import AssetService
+from services.loop_monitor_service import LoopMonitorService
+from services.health_service import (
+    HealthService,
+    ASSETS_VERIFYING,
+    ASSETS_DOWNLOADING,
+    ASSETS_BUILDING,
+    ASSETS_READY,
+    ASSETS_FAILED,
+)
+
+# Set by the cluster launcher, tells the processes apart in the logs
+CLUSTER_TAG = f"[{os.environ['CLUSTER_ID']}] " if "CLUSTER_ID" in os.environ else ""
 
 logging.basicConfig(
     stream=sys.stdout,
     level=logging.INFO,
     datefmt="%Y-%m-%d %H:%M:%S",
-    format="%(asctime)s %(levelname)-7s %(name)-25s %(message)s",
+    format=f"%(asctime)s %(levelname)-7s {CLUSTER_TAG}%(name)-25s %(message)s",
 )
 logging.getLogger().addHandler(PrometheusLoggingHandler())
 log = logging.getLogger(__name__)
 
-ORIGINAL_DIR = Path("./pokemons", "originals")
-REVEALED_DIR = Path("./pokemons", "revealed")
-HIDDEN_DIR = Path("./pokemons", "hidden")
+POKEGUESS_READY_SECONDS = Gauge(
+    "pokeguess_ready_seconds",
+    "Seconds from the start of the process to the first ready event",
+    ["profile"],
+)
+
+# Gateway profiles, lean does not receive nor keep the guild members
+GATEWAY_PROFILES = ("full", "lean")
+
+
+def verify_pokemon_images():
+    log.info("Verifying pokemon images")
+    AssetService().verify()
 
 
 def download_pokemon_images():
     log.info("Downloading pokemon images")
-    PokedexService().download_all_pokemon()
+    PokedexService().download_all_pokemon(
+        refresh=os.getenv("POKEDEX_REFRESH", "false") == "true"
+    )
 
 
 def process_pokemon_images():
     log.info("Processing pokemon images")
-    image_service = ImageService()
-    for file in os.listdir(ORIGINAL_DIR):
-        original_path = Path(ORIGINAL_DIR, file)
-        hidden_path = Path(HIDDEN_DIR, file)
-        revealed_path = Path(REVEALED_DIR, file)
-
-        # Already processed, skipping
-        if hidden_path.exists() and revealed_path.exists():
-            continue
-
-        image_service.process_image(
-            original_path=original_path,
-            hidden_path=hidden_path,
-            revealed_path=revealed_path,
+    AssetService().build()
+
+
+async def prepare_pokemon_images(bot: commands.Bot, health_service: HealthService):
+    """
+    Prepares the images in a thread while the bot is running, the controllers
+    are notified with the `assets_ready` event
+    """
+    try:
+        health_service.set_assets_state(ASSETS_VERIFYING)
+        await asyncio.to_thread(verify_pokemon_images)
+
+        health_service.set_assets_state(ASSETS_DOWNLOADING)
+        await asyncio.to_thread(download_pokemon_images)
+
+        health_service.set_assets_state(ASSETS_BUILDING)
+        await asyncio.to_thread(process_pokemon_images)
+    except Exception:
+        log.exception("Could not prepare the pokemon images")
+        health_service.set_assets_state(ASSETS_FAILED)
+        return
+
+    set_assets_ready(bot, health_service)
+
+
+def set_assets_ready(bot: commands.Bot, health_service: HealthService):
+    health_service.set_assets_state(ASSETS_READY)
+    bot.dispatch("assets_ready")
+
+
+def get_shards_state(bot: commands.AutoShardedBot) -> dict[int, bool]:
+    """If each shard is connected, called from the health server thread"""
+    if not bot.is_ready() or bot.is_closed():
+        return {}
+
+    return {
+        shard_id: not shard.is_closed() for shard_id, shard in list(bot.shards.items())
+    }
+
+
+def get_stub_shards_state(bot: commands.AutoShardedBot) -> dict[int, bool]:
+    if bot.is_closed():
+        return {}
+
+    return {shard_id: True for shard_id in bot.shard_ids or [0]}
+
+
+def get_gateway_options(profile: str, guess_mode: str = "message") -> dict:
+    """Intents and member cache of the bot for the gateway profile"""
+    if profile not in GATEWAY_PROFILES:
+        raise ValueError(
+            f"Unknown GATEWAY_PROFILE {profile}, expected one of {GATEWAY_PROFILES}"
         )
 
+    intents = Intents()
+    intents.guilds = True
+
+    if guess_mode == "message":
+        intents.guild_messages = True
+        intents.message_content = True
+    else:
+        # The guesses come with interactions, only the !sync private message is read
+        intents.dm_messages = True
+
+    if profile == "lean":
+        # The authors of the messages and interactions come with the events
+        return {
+            "intents": intents,
+            "chunk_guilds_at_startup": False,
+            "member_cache_flags": MemberCacheFlags.none(),
+        }
+
+    intents.members = True
+    return {"intents": intents}
+
+
+def get_peak_memory_mb() -> Optional[float]:
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None  # Windows
+
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def report_ready(bot: commands.AutoShardedBot, profile: str, start_time: float):
+    """Logs what the gateway profile costs, to compare them"""
+    ready_seconds = time.monotonic() - start_time
+    POKEGUESS_READY_SECONDS.labels(profile).set(ready_seconds)
+
+    members = sum(len(guild.members) for guild in bot.guilds)
+    memory = get_peak_memory_mb()
+    memory_text = "unknown" if memory is None else f"{memory:.0f}MB"
+
+    log.info(
+        f"Ready with the {profile} gateway profile in {ready_seconds:.1f}s, "
+        f"{len(bot.guilds)} guilds, {members} members cached, "
+        f"peak memory {memory_text}"
+    )
+
+
+async def run_stub_gateway(bot: commands.AutoShardedBot):
+    """Runs the bot without connecting to Discord, to try the cluster locally"""
+    log.warning("Using the stub gateway, the bot does not connect to Discord")
+
+    # pylint: disable=protected-access
+    bot._connection.user = ClientUser(
+        state=bot._connection,
+        data={"id": 0, "username": "stub", "discriminator": "0000", "avatar": None},
+    )
+    # pylint: enable=protected-access
+
+    async with bot:
+        bot.dispatch("ready")
+
+        while not bot.is_closed():
+            await asyncio.sleep(1)
+
 
 async def main():
+    start_time = time.monotonic()
     load_dotenv()
 
-    intents = Intents()
-    intents.members = True
-    intents.guilds = True
-    intents.guild_messages = True
-    intents.message_content = True
+    profile = os.getenv("GATEWAY_PROFILE", "full")
+    guess_mode = get_guess_mode()
+    log.info(f"Using the {profile} gateway profile and the {guess_mode} guess mode")
+
+    # Only the shards of this process when started by the cluster launcher
+    shard_ids = None
+    shard_count = None
+    if os.getenv("CLUSTER_SHARD_IDS"):
+        shard_ids = [int(i) for i in os.environ["CLUSTER_SHARD_IDS"].split(",")]
+        shard_count = int(os.environ["SHARD_COUNT"])
+        log.info(f"Running shards {shard_ids} of {shard_count}")
 
     bot = commands.AutoShardedBot(
         command_prefix="!",
-        intents=intents,
         help_command=None,
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        **get_gateway_options(profile, guess_mode),
     )
 
-    await bot.add_cog(PrometheusCog(bot))
+    # Reported once, reconnections fire it again
+    async def on_ready():
+        bot.remove_listener(on_ready)
+        report_ready(bot, profile, start_time)
+
+    bot.add_listener(on_ready)
+
+    await bot.add_cog(PrometheusCog(bot, port=int(os.getenv("METRICS_PORT", "8000"))))
 
     await controllers.add_cogs(bot)
 
@@ -75,11 +222,53 @@ async def main():
     for command in bot.walk_commands():
         log.info(f"\t{command.name}")
 
-    # Prepare the data before running the bot
-    download_pokemon_images()
-    process_pokemon_images()
+    stub_gateway = os.getenv("STUB_GATEWAY", "false") == "true"
+
+    if stub_gateway:
+        health_service = HealthService(lambda: get_stub_shards_state(bot))
+    else:
+        health_service = HealthService(lambda: get_shards_state(bot))
+
+    loop = asyncio.get_running_loop()
+
+    # Stopping the container closes the bot, the controllers save their state
+    try:
+        loop.add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.create_task(bot.close())
+        )
+        # Stopped by the cluster launcher, not by the Ctrl+C of its terminal
+        if "CLUSTER_ID" in os.environ:
+            loop.add_signal_handler(signal.SIGINT, lambda: None)
+    except NotImplementedError:
+        pass  # Windows
+
+    assets_task = None
+    if os.getenv("PREPARE_ASSETS", "true") == "true":
+        # The bot connects right away, the images are prepared meanwhile
+        assets_task = asyncio.create_task(prepare_pokemon_images(bot, health_service))
+    else:
+        # Prepared once for every process by the cluster launcher, it signals when done
+        loop.add_signal_handler(signal.SIGUSR1, set_assets_ready, bot, health_service)
+
+    # The cluster launcher signals the process once this answers
+    health_service.start()
+
+    loop_monitor_service = LoopMonitorService()
+    loop_monitor_service.start()
+
+    try:
+        if stub_gateway:
+            await run_stub_gateway(bot)
+        else:
+            await bot.start(os.environ["DISCORD_BOT_TOKEN"])
+    finally:
+        if assets_task is not None:
+            assets_task.cancel()
+        health_service.stop()
+        loop_monitor_service.stop()
 
-    await bot.start(os.environ["DISCORD_BOT_TOKEN"])
+        for name in list(bot.cogs):
+            await bot.remove_cog(name)
 
 
 if __name__ == "__main__":
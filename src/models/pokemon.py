@@ -7,6 +7,10 @@ from typing import Optional
 class Pokemon:
     name: str
     id: Optional[int]
-    hidden_img_path: Path
-    revealed_img_path: Path
+    hidden_img_path: Optional[Path]
+    revealed_img_path: Optional[Path]
     original_img_path: Optional[Path]
+    generation: Optional[int] = None
+    # In memory PNG content, used by custom pokemons instead of the paths
+    hidden_img: Optional[bytes] = None
+    revealed_img: Optional[bytes] = None
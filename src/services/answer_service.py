@@ -0,0 +1,87 @@
+import string
+import unicodedata
+from enum import Enum
+import Levenshtein
+
+# Symbols that are part of the name, kept as letters
+SYMBOLS = str.maketrans({"♀": "f", "♂": "m"})
+
+# Punctuation and whitespace of the ASCII messages, removed as bytes (faster)
+ASCII_DELETE = (string.punctuation + string.whitespace).encode("ascii")
+
+# Other accepted answers, by normalized name
+ALIASES: dict[str, tuple[str, ...]] = {
+    "nidoranf": ("nidoran", "nidoranfemale"),
+    "nidoranm": ("nidoran", "nidoranmale"),
+    "mrmime": ("mistermime",),
+    "mrrime": ("misterrime",),
+    "mimejr": ("mimejunior",),
+    "farfetchd": ("farfetched",),
+    "sirfetchd": ("sirfetched",),
+}
+
+
+class Match(Enum):
+    NONE = 0
+    # One letter away from an answer
+    CLOSE = 1
+    EXACT = 2
+
+
+def normalize(text: str) -> str:
+    """
+    Lower case letters and digits only, without accents, punctuation or
+    whitespace. "Mr. Mime" and "mr mime" are both "mrmime"
+    """
+    if text.isascii():
+        return (
+            text.encode("ascii").translate(None, ASCII_DELETE).lower().decode("ascii")
+        )
+
+    text = unicodedata.normalize("NFKD", text.translate(SYMBOLS))
+    return "".join(char for char in text if char.isalnum()).casefold()
+
+
+class AnswerMatcher:
+    """
+    Compares the messages to the name of one pokemon. The answers are
+    normalized once when the game starts, messages whose length is too far
+    from every answer are rejected before being normalized.
+    """
+
+    def __init__(self, name: str) -> None:
+        answer = normalize(name)
+
+        # Nothing left of a custom name made of symbols
+        if answer == "":
+            answer = name.strip().casefold()
+
+        self.answers = {answer, *ALIASES.get(answer, ())}
+
+        self.min_length = min(len(answer) for answer in self.answers)
+        self.max_length = max(len(answer) for answer in self.answers)
+
+        # Generous, punctuation and spaces are removed from the message
+        self.max_message_length = self.max_length * 4 + 8
+
+    def match(self, text: str) -> Match:
+        if len(text) > self.max_message_length:
+            return Match.NONE
+
+        # Normalizing ASCII only removes characters, too short to ever match
+        if len(text) < self.min_length - 1 and text.isascii():
+            return Match.NONE
+
+        text = normalize(text) or text.strip().casefold()
+
+        if len(text) < self.min_length - 1 or len(text) > self.max_length + 1:
+            return Match.NONE
+
+        if text in self.answers:
+            return Match.EXACT
+
+        for answer in self.answers:
+            if Levenshtein.distance(text, answer, score_cutoff=1) == 1:
+                return Match.CLOSE
+
+        return Match.NONE
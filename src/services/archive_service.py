@@ -0,0 +1,162 @@
+import os
+import io
+import json
+import mmap
+import struct
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional
+from services.image_service import TMP_FILE_PREFIX, HIDDEN, REVEALED
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_PATH = Path("./pokemons/pokemons.pack")
+
+# File layout:
+#   MAGIC
+#   index size (unsigned 32 bits little endian)
+#   index, JSON list of {"id", "variant", "file", "offset", "length"}
+#   image data, offsets are relative to the end of the index
+MAGIC = b"PKGUESS1"
+INDEX_SIZE = struct.Struct("<I")
+
+
+class ArchiveServiceException(Exception):
+    pass
+
+
+class ArchiveService:
+    """
+    Packs every rendered image into a single file and serves them from a
+    read only memory mapping, shared between processes by the page cache.
+    """
+
+    def __init__(self, path: Path = ARCHIVE_PATH) -> None:
+        self.path = path
+
+        self._file: io.BufferedReader = None
+        self._mapping: mmap.mmap = None
+
+        # (id, variant) -> (offset, length)
+        self._images: dict[tuple[int, str], tuple[int, int]] = {}
+        # id -> file name of the images
+        self._files: dict[int, str] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self._mapping is not None
+
+    def write(self, hidden_dir: Path, revealed_dir: Path, extension: str) -> int:
+        """Packs the images with the extension, returns how many images were packed"""
+        sources = []
+        for file in sorted(os.listdir(hidden_dir)):
+            if file.startswith(TMP_FILE_PREFIX) or not file.endswith(extension):
+                continue
+
+            # Only complete pokemons, both images are needed for a game
+            if not Path(revealed_dir, file).exists():
+                continue
+
+            pokemon_id = int(file.split("_")[0])
+            sources.append((pokemon_id, HIDDEN, file, Path(hidden_dir, file)))
+            sources.append((pokemon_id, REVEALED, file, Path(revealed_dir, file)))
+
+        index = []
+        offset = 0
+        for pokemon_id, variant, file, path in sources:
+            length = path.stat().st_size
+            index.append(
+                {
+                    "id": pokemon_id,
+                    "variant": variant,
+                    "file": file,
+                    "offset": offset,
+                    "length": length,
+                }
+            )
+            offset += length
+
+        index_data = json.dumps(index).encode("utf-8")
+
+        # Written next to the archive, then renamed over it
+        fd, tmp_path = tempfile.mkstemp(prefix=TMP_FILE_PREFIX, dir=self.path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC)
+                f.write(INDEX_SIZE.pack(len(index_data)))
+                f.write(index_data)
+                for _, _, _, path in sources:
+                    with open(path, "rb") as source:
+                        f.write(source.read())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        log.info(f"Packed {len(sources)} images in {self.path} ({offset} bytes)")
+
+        return len(sources)
+
+    def load(self) -> bool:
+        """Maps the archive in memory, returns False if there is no archive"""
+        if not self.path.exists():
+            log.info(f"No archive at {self.path}")
+            return False
+
+        self.close()
+
+        self._file = open(self.path, "rb")
+        self._mapping = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mapping[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ArchiveServiceException(f"{self.path} is not a pokemon archive")
+
+        (index_size,) = INDEX_SIZE.unpack_from(self._mapping, len(MAGIC))
+        index_start = len(MAGIC) + INDEX_SIZE.size
+        data_start = index_start + index_size
+
+        index = json.loads(self._mapping[index_start:data_start])
+
+        self._images = {
+            (entry["id"], entry["variant"]): (
+                data_start + entry["offset"],
+                entry["length"],
+            )
+            for entry in index
+        }
+        self._files = {entry["id"]: entry["file"] for entry in index}
+
+        log.info(f"Loaded {len(self._images)} images from {self.path}")
+
+        return True
+
+    def close(self):
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        self._images = {}
+        self._files = {}
+
+    def get_image(self, pokemon_id: int, variant: str) -> Optional[bytes]:
+        if self._mapping is None:
+            return None
+
+        location = self._images.get((pokemon_id, variant))
+        if location is None:
+            return None
+
+        offset, length = location
+        return self._mapping[offset : offset + length]
+
+    def get_ids(self) -> list[int]:
+        """Ids of the packed pokemons, sorted"""
+        return sorted(self._files)
+
+    def get_file_name(self, pokemon_id: int) -> Optional[str]:
+        return self._files.get(pokemon_id)
@@ -0,0 +1,407 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import multiprocessing
+from pathlib import Path
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Optional
+from PIL import Image
+from services.image_service import (
+    ImageService,
+    TMP_FILE_PREFIX,
+    HIDDEN,
+    REVEALED,
+    get_encoding,
+    get_render_parameters_hash,
+)
+from services.archive_service import ArchiveService
+
+log = logging.getLogger(__name__)
+
+ORIGINAL_DIR = Path("./pokemons", "originals")
+REVEALED_DIR = Path("./pokemons", "revealed")
+HIDDEN_DIR = Path("./pokemons", "hidden")
+
+# What every output was rendered from, only the outdated ones are rendered again
+MANIFEST_PATH = Path("./pokemons", "manifest.json")
+MANIFEST_VERSION = 1
+
+# Last chunk of every complete PNG file
+PNG_END = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+# Minimum time between two progress logs
+PROGRESS_INTERVAL = 2.0
+
+# One image service per worker process, keeps the background image cached
+_worker_image_service: ImageService = None
+
+
+def _init_worker():
+    global _worker_image_service
+    _worker_image_service = ImageService()
+
+
+def _render(file: str) -> dict:
+    """Renders in the worker process, returns the size and hash of the outputs"""
+    output_file = get_output_file(file)
+    hidden_path = Path(HIDDEN_DIR, output_file)
+    revealed_path = Path(REVEALED_DIR, output_file)
+
+    _worker_image_service.process_image(
+        original_path=Path(ORIGINAL_DIR, file),
+        hidden_path=hidden_path,
+        revealed_path=revealed_path,
+    )
+
+    return {
+        HIDDEN: {"size": hidden_path.stat().st_size, "sha256": hash_file(hidden_path)},
+        REVEALED: {
+            "size": revealed_path.stat().st_size,
+            "sha256": hash_file(revealed_path),
+        },
+    }
+
+
+def get_output_file(file: str) -> str:
+    """Name of the hidden and revealed images, the extension follows the encoding"""
+    return str(Path(file).with_suffix(get_encoding().extension))
+
+
+def hash_file(path: Path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def is_complete_png(path: Path) -> bool:
+    """Truncated downloads are missing the last chunk"""
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) < len(PNG_END):
+            return False
+
+        f.seek(-len(PNG_END), os.SEEK_END)
+        return f.read() == PNG_END
+
+
+def is_valid_original(path: Path) -> bool:
+    """If the original is a complete image that can be decoded"""
+    if not is_complete_png(path):
+        return False
+
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        return False
+
+    return True
+
+
+def _verify(file: str, entry: Optional[dict]) -> tuple[bool, bool, bool]:
+    """
+    Checks one pokemon, returns if the original and if the outputs are valid,
+    and if the original changed since the outputs were rendered
+    """
+    original_path = Path(ORIGINAL_DIR, file)
+
+    # Never rendered, only the file itself can tell if it is complete
+    if entry is None:
+        return is_valid_original(original_path), True, False
+
+    # Edited since it was rendered, the outputs are rendered again by the build
+    if hash_file(original_path) != entry["source"]:
+        return is_valid_original(original_path), False, True
+
+    for variant, directory in ((HIDDEN, HIDDEN_DIR), (REVEALED, REVEALED_DIR)):
+        path = Path(directory, entry["output"])
+
+        # Missing outputs are not corrupted, they are rendered by the build
+        if not path.exists():
+            continue
+
+        if (
+            path.stat().st_size != entry[variant]["size"]
+            or hash_file(path) != entry[variant]["sha256"]
+        ):
+            return True, False, False
+
+    return True, True, False
+
+
+class AssetService:
+    """Renders the hidden and revealed images of every downloaded pokemon."""
+
+    def __init__(self, jobs: Optional[int] = None) -> None:
+        self.jobs = jobs or os.cpu_count() or 1
+
+    def remove_temporary_files(self):
+        """Removes the leftovers of an interrupted build"""
+        for directory in (HIDDEN_DIR, REVEALED_DIR):
+            if not directory.exists():
+                continue
+
+            for file in os.listdir(directory):
+                if file.startswith(TMP_FILE_PREFIX):
+                    log.info(f"Removing unfinished file {file}")
+                    os.remove(Path(directory, file))
+
+    def load_manifest(self) -> dict[str, dict]:
+        """Manifest entries by original file name"""
+        if not MANIFEST_PATH.exists():
+            return {}
+
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        # Unknown format, everything is rendered again
+        if manifest.get("version") != MANIFEST_VERSION:
+            log.warning(f"Ignoring {MANIFEST_PATH}, unknown version")
+            return {}
+
+        return manifest["images"]
+
+    def save_manifest(self, images: dict[str, dict]):
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=TMP_FILE_PREFIX, dir=MANIFEST_PATH.parent
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "images": images}, f)
+            os.replace(tmp_path, MANIFEST_PATH)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def get_pending_files(
+        self, manifest: dict[str, dict], parameters_hash: str
+    ) -> dict[str, str]:
+        """
+        Original images whose outputs are missing or were rendered from another
+        original or with other parameters, with the hash of the original
+        """
+        pending = {}
+
+        for file in sorted(os.listdir(ORIGINAL_DIR)):
+            if file.startswith(TMP_FILE_PREFIX):
+                continue
+
+            source_hash = hash_file(Path(ORIGINAL_DIR, file))
+            entry = manifest.get(file)
+
+            # Already processed, skipping
+            output_file = get_output_file(file)
+            if (
+                entry is not None
+                and entry["source"] == source_hash
+                and entry["parameters"] == parameters_hash
+                and entry["output"] == output_file
+                and Path(HIDDEN_DIR, output_file).exists()
+                and Path(REVEALED_DIR, output_file).exists()
+            ):
+                continue
+
+            pending[file] = source_hash
+
+        return pending
+
+    def verify(self) -> int:
+        """
+        Checks every original and rendered image against the manifest in
+        parallel. The corrupted ones are removed, to be downloaded or
+        rendered again. The outputs of the originals that changed are
+        removed, to be rendered again. Returns how many pokemons were
+        corrupted.
+        """
+        if not ORIGINAL_DIR.exists():
+            return 0
+
+        start_time = time.perf_counter()
+
+        manifest = self.load_manifest()
+        files = [
+            file
+            for file in os.listdir(ORIGINAL_DIR)
+            if not file.startswith(TMP_FILE_PREFIX)
+        ]
+
+        corrupted = 0
+        changed = 0
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = {
+                pool.submit(_verify, file, manifest.get(file)): file for file in files
+            }
+
+            for future in as_completed(futures):
+                file = futures[future]
+                try:
+                    original_valid, outputs_valid, source_changed = future.result()
+                except OSError:
+                    log.exception(f"Could not verify {file}")
+                    continue
+
+                if original_valid and outputs_valid:
+                    continue
+
+                entry = manifest.pop(file, None)
+
+                if not original_valid:
+                    corrupted += 1
+                    log.warning(f"Original image {file} is corrupted, removing it")
+                    os.remove(Path(ORIGINAL_DIR, file))
+                elif source_changed:
+                    # Edited by hand, or downloaded again, it is not lost
+                    changed += 1
+                    log.info(f"Original image {file} changed, removing its renders")
+                else:
+                    corrupted += 1
+                    log.warning(
+                        f"Rendered images of {file} are corrupted, removing them"
+                    )
+
+                if entry is not None:
+                    for directory in (HIDDEN_DIR, REVEALED_DIR):
+                        Path(directory, entry["output"]).unlink(missing_ok=True)
+
+        if corrupted > 0 or changed > 0:
+            self.save_manifest(manifest)
+
+        log.info(
+            f"Verified {len(files)} pokemons in {time.perf_counter() - start_time:.2f}s, "
+            f"{corrupted} corrupted, {changed} changed"
+        )
+
+        return corrupted
+
+    def remove_orphaned_files(self, manifest: dict[str, dict]) -> int:
+        """
+        Removes the rendered images of the pokemons that have no original
+        anymore, like the ones that were renamed. Returns how many were removed.
+        """
+        outputs = {
+            get_output_file(file)
+            for file in os.listdir(ORIGINAL_DIR)
+            if not file.startswith(TMP_FILE_PREFIX)
+        }
+
+        removed = 0
+        for file in list(manifest):
+            if manifest[file]["output"] not in outputs:
+                del manifest[file]
+
+        for directory in (HIDDEN_DIR, REVEALED_DIR):
+            if not directory.exists():
+                continue
+
+            for file in os.listdir(directory):
+                if file.startswith(TMP_FILE_PREFIX) or file in outputs:
+                    continue
+
+                # Rendered with another encoding, kept in case it is used again
+                if not file.endswith(get_encoding().extension):
+                    continue
+
+                log.info(
+                    f"Removing {Path(directory, file)}, its original image is gone"
+                )
+                os.remove(Path(directory, file))
+                removed += 1
+
+        return removed
+
+    def build(self) -> int:
+        """
+        Renders the pending images in a process pool and packs them in the
+        archive, returns how many were rendered
+        """
+        self.remove_temporary_files()
+
+        archive_service = ArchiveService()
+
+        manifest = self.load_manifest()
+        removed = self.remove_orphaned_files(manifest)
+        parameters_hash = get_render_parameters_hash()
+
+        pending = self.get_pending_files(manifest, parameters_hash)
+        originals = [
+            file
+            for file in os.listdir(ORIGINAL_DIR)
+            if not file.startswith(TMP_FILE_PREFIX)
+        ]
+        skipped = len(originals) - len(pending)
+
+        if len(pending) == 0:
+            log.info(f"All {skipped} images are up to date")
+            if removed > 0:
+                self.save_manifest(manifest)
+            if removed > 0 or not archive_service.path.exists():
+                self.write_archive(archive_service)
+            return 0
+
+        jobs = min(self.jobs, len(pending))
+        log.info(
+            f"{skipped} images are up to date, "
+            f"processing {len(pending)} images with {jobs} processes"
+        )
+
+        start_time = time.perf_counter()
+        last_progress = start_time
+        done = 0
+        failed = 0
+
+        # Built in a thread of the running bot, forking it would copy its locks
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as pool:
+            futures = {pool.submit(_render, file): file for file in pending}
+
+            try:
+                for future in as_completed(futures):
+                    file = futures[future]
+                    try:
+                        outputs = future.result()
+                        done += 1
+                    except Exception:
+                        failed += 1
+                        log.exception(f"Image processing failed for {file}")
+                        continue
+
+                    manifest[file] = {
+                        "source": pending[file],
+                        "parameters": parameters_hash,
+                        "output": get_output_file(file),
+                        **outputs,
+                    }
+
+                    now = time.perf_counter()
+                    if now - last_progress >= PROGRESS_INTERVAL:
+                        last_progress = now
+                        log.info(
+                            f"Progress {done + failed}/{len(pending)} "
+                            f"({done / (now - start_time):.1f} images/s)"
+                        )
+            except BaseException:
+                # Interrupted, finished images are kept and the rest is resumed on the next build
+                log.warning(f"Build interrupted after {done} images")
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+            finally:
+                self.save_manifest(manifest)
+
+        elapsed = time.perf_counter() - start_time
+        log.info(
+            f"Processed {done} images in {elapsed:.1f}s "
+            f"({done / elapsed:.1f} images/s), {failed} failed, {skipped} skipped"
+        )
+
+        self.write_archive(archive_service)
+
+        return done
+
+    def write_archive(self, archive_service: ArchiveService):
+        log.info("Packing the images")
+        archive_service.write(HIDDEN_DIR, REVEALED_DIR, get_encoding().extension)
@@ -0,0 +1,131 @@
+import os
+import time
+import logging
+from pathlib import Path
+from typing import Optional
+from models.pokemon import Pokemon
+from services.image_service import TMP_FILE_PREFIX, get_encoding
+from services.archive_service import ArchiveService
+
+log = logging.getLogger(__name__)
+
+HIDDEN_IMG_DIR = Path("./pokemons/hidden/")
+REVEALED_IMG_DIR = Path("./pokemons/revealed/")
+
+# First and last pokemon id of each generation, Missingno (0) is in the first
+GENERATIONS = {
+    1: (0, 151),
+    2: (152, 251),
+    3: (252, 386),
+    4: (387, 493),
+    5: (494, 649),
+    6: (650, 721),
+    7: (722, 809),
+    8: (810, 905),
+}
+
+
+def get_generation(pokemon_id: int) -> Optional[int]:
+    for generation, (first, last) in GENERATIONS.items():
+        if first <= pokemon_id <= last:
+            return generation
+
+    return None
+
+
+def parse_file_name(file: str) -> tuple[int, str]:
+    """Id and name of the pokemon from its images file name, like 25_Pikachu.png"""
+    first_underscore = file.index("_")
+    last_dot = file.rindex(".")
+
+    return int(file[0:first_underscore]), file[first_underscore + 1 : last_dot]
+
+
+def make_pokemon(file: str) -> Pokemon:
+    """Creates the pokemon from its images file name"""
+    pokemon_id, name = parse_file_name(file)
+
+    return Pokemon(
+        id=pokemon_id,
+        name=name,
+        hidden_img_path=Path(HIDDEN_IMG_DIR, file),
+        revealed_img_path=Path(REVEALED_IMG_DIR, file),
+        original_img_path=None,  # Hiding it
+        generation=get_generation(pokemon_id),
+    )
+
+
+class CatalogService:
+    """
+    Index of the pokemons that can be played, by id and by generation.
+
+    Built from the archive index when it is loaded, from the rendered images
+    otherwise. Lookups never touch the file system, call `reload` once the
+    images changed.
+    """
+
+    def __init__(self, archive_service: Optional[ArchiveService] = None) -> None:
+        self.archive_service = archive_service
+
+        self._pokemons: dict[int, Pokemon] = {}
+        # generation -> sorted ids, 0 is every generation
+        self._ids: dict[int, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pokemons)
+
+    def _list_files(self) -> list[str]:
+        """Images file names, complete pokemons only"""
+        if self.archive_service is not None and self.archive_service.loaded:
+            return [
+                self.archive_service.get_file_name(pokemon_id)
+                for pokemon_id in self.archive_service.get_ids()
+            ]
+
+        if not HIDDEN_IMG_DIR.exists():
+            return []
+
+        extension = get_encoding().extension
+
+        return [
+            file
+            for file in os.listdir(HIDDEN_IMG_DIR)
+            # Image still being written or rendered with another encoding
+            if not file.startswith(TMP_FILE_PREFIX)
+            and file.endswith(extension)
+            and Path(REVEALED_IMG_DIR, file).exists()
+        ]
+
+    def reload(self):
+        start_time = time.perf_counter()
+
+        pokemons = {}
+        for file in self._list_files():
+            pokemon = make_pokemon(file)
+            pokemons[pokemon.id] = pokemon
+
+        ids = {0: []}
+        for pokemon_id in sorted(pokemons):
+            generation = pokemons[pokemon_id].generation
+
+            # Only the known generations can be played
+            if generation is None:
+                continue
+
+            ids[0].append(pokemon_id)
+            ids.setdefault(generation, []).append(pokemon_id)
+
+        # Swapped at once, lookups never see a half built index
+        self._pokemons, self._ids = pokemons, ids
+
+        log.info(
+            f"Indexed {len(pokemons)} pokemons "
+            f"in {(time.perf_counter() - start_time) * 1000:.1f}ms"
+        )
+
+    def get_pokemon(self, pokemon_id: int) -> Optional[Pokemon]:
+        return self._pokemons.get(pokemon_id)
+
+    def get_ids(self, generation: int = 0) -> list[int]:
+        """Ids of the pokemons of the generation, 0 for every generation"""
+        return self._ids.get(generation, [])
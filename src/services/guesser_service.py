@@ -1,20 +1,18 @@
-import os
-from pathlib import Path
+import asyncio
 import logging
 import re
-from typing import Union, Callable, Awaitable
+from typing import Union, Callable, Awaitable, Optional
 from datetime import datetime
 from discord import TextChannel
-from discord.ext import tasks
 from models.pokemon import Pokemon
 from models.guesser import Guesser
+from services.catalog_service import CatalogService
+from services.journal_service import JournalService
+from services.answer_service import AnswerMatcher, Match
 from prometheus_client import Counter
 
 log = logging.getLogger(__name__)
 
-HIDDEN_IMG_DIR = Path("./pokemons/hidden/")
-REVEALED_IMG_DIR = Path("./pokemons/revealed/")
-
 POKEGUESS_RESULT_COUNTER = Counter(
     "pokeguess_guess_result",
     "The outcome of a pokeguess, did the users got the right answer?",
@@ -31,39 +29,42 @@ class GuesserAlreadyActiveException(GuesserServiceException):
 
 
 class GuesserService:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        catalog_service: Optional[CatalogService] = None,
+        journal_service: Optional[JournalService] = None,
+    ) -> None:
         # Guesser by channel_id
         self.active_guess: dict[int, Guesser] = {}
 
-        self.on_guesser_end_event: list[Callable[[Guesser], Awaitable[None]]] = []
+        # Empty until the images are indexed, compared to None
+        self.catalog_service = (
+            catalog_service if catalog_service is not None else CatalogService()
+        )
 
-        # pylint: disable=no-member
-        self.end_guesses_loop.start()
-        # pylint: enable=no-member
+        # Keeps the games across restarts, when given
+        self.journal_service = journal_service
 
-    def get_pokemon_by_id(self, pokemon_id):
-        log.info(f"Searching for pokemon #{pokemon_id} in the file system")
+        # Compiled once per game, by channel_id
+        self._matchers: dict[int, AnswerMatcher] = {}
 
-        for file in os.listdir(HIDDEN_IMG_DIR):
-            first_underscore = file.index("_")
-            last_dot = len(file) - file[::-1].index(".") - 1
+        self.on_guesser_end_event: list[Callable[[Guesser], Awaitable[None]]] = []
 
-            pokemon_name = file[first_underscore + 1 : last_dot]
+        # Ends each guesser at its end time, by channel_id
+        self._timers: dict[int, asyncio.TimerHandle] = {}
+        # Guessers being ended by their timer, keeps a reference to the tasks
+        self._expiring: set[asyncio.Task] = set()
 
-            if pokemon_id == int(file[0:first_underscore]):
-                return Pokemon(
-                    id=pokemon_id,
-                    name=pokemon_name,
-                    hidden_img_path=Path(HIDDEN_IMG_DIR, file),
-                    revealed_img_path=Path(REVEALED_IMG_DIR, file),
-                    original_img_path=None,  # Hiding it
-                )
+    def get_pokemon_by_id(self, pokemon_id: int) -> Optional[Pokemon]:
+        pokemon = self.catalog_service.get_pokemon(pokemon_id)
 
-        log.error(f"Pokemon #{pokemon_id} not found")
+        if pokemon is None:
+            log.error(f"Pokemon #{pokemon_id} not found")
 
-        return None
+        return pokemon
 
-    def add_guesser(self, guesser: Guesser) -> None:
+    def add_guesser(self, guesser: Guesser, restored: bool = False) -> None:
+        """Starts the guesser, `restored` when resumed from the journal"""
         if guesser.channel.id in self.active_guess:
             raise GuesserAlreadyActiveException()
 
@@ -72,12 +73,42 @@ class GuesserService:
         )
 
         self.active_guess[guesser.channel.id] = guesser
+        self._matchers[guesser.channel.id] = AnswerMatcher(guesser.pokemon.name)
+
+        if self.journal_service is not None:
+            self.journal_service.start(guesser, restored)
+
+        # Woken up once, when the guesser expires, instead of polling every guesser
+        delay = (guesser.end_time - datetime.utcnow()).total_seconds()
+        self._timers[guesser.channel.id] = asyncio.get_running_loop().call_later(
+            max(delay, 0), self._expire, guesser
+        )
+
+    def _expire(self, guesser: Guesser):
+        task = asyncio.create_task(self._end_expired_guesser(guesser))
+        self._expiring.add(task)
+        task.add_done_callback(self._expiring.discard)
+
+    async def _end_expired_guesser(self, guesser: Guesser):
+        # Ended by a winner in the meantime
+        if self.active_guess.get(guesser.channel.id) is not guesser:
+            return
+
+        await self.end_guesser(guesser.channel)
 
     async def end_guesser(self, channel: TextChannel):
         if channel.id not in self.active_guess:
             raise GuesserServiceException()
 
         guesser = self.active_guess.pop(channel.id)
+        self._matchers.pop(channel.id, None)
+
+        timer = self._timers.pop(channel.id, None)
+        if timer is not None:
+            timer.cancel()
+
+        if self.journal_service is not None:
+            self.journal_service.end(guesser)
 
         log.info(
             f"Ending guesser for pokemon #{guesser.pokemon.id} in channel {channel.id}"
@@ -96,21 +127,18 @@ class GuesserService:
             except:
                 log.exception("Unhandled exception while calling on_guesser_end_event")
 
+    def match_answer(self, guesser: Guesser, text: str) -> Match:
+        """How close the text is to the name of the guesser's pokemon"""
+        return self._matchers[guesser.channel.id].match(text)
+
+    def add_hint(self, guesser: Guesser):
+        guesser.hints_given += 1
+
+        if self.journal_service is not None:
+            self.journal_service.hint(guesser)
+
     def get_guesser(self, channel: Union[TextChannel, int]) -> Guesser:
         if isinstance(channel, int):
             return self.active_guess.get(channel, None)
 
         return self.active_guess.get(channel.id, None)
-
-    @tasks.loop(seconds=1)
-    async def end_guesses_loop(self):
-        try:
-            channels_ids = list(self.active_guess.keys())
-
-            for channel_id in channels_ids:
-                guesser = self.get_guesser(channel_id)
-
-                if guesser.end_time < datetime.utcnow():
-                    await self.end_guesser(guesser.channel)
-        except:
-            pass
@@ -0,0 +1,118 @@
+import os
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from prometheus_client import Enum
+
+log = logging.getLogger(__name__)
+
+# Steps of the asset preparation, in order
+ASSETS_PENDING = "pending"
+ASSETS_VERIFYING = "verifying"
+ASSETS_DOWNLOADING = "downloading"
+ASSETS_BUILDING = "building"
+ASSETS_READY = "ready"
+ASSETS_FAILED = "failed"
+
+ASSETS_STATE_ENUM = Enum(
+    "pokeguess_assets_state",
+    "Preparation step of the pokemon images",
+    states=[
+        ASSETS_PENDING,
+        ASSETS_VERIFYING,
+        ASSETS_DOWNLOADING,
+        ASSETS_BUILDING,
+        ASSETS_READY,
+        ASSETS_FAILED,
+    ],
+)
+
+
+class HealthService:
+    """
+    Serves the state of the bot over HTTP for the orchestrator, next to the
+    Prometheus server.
+
+    `/health` always answers 200 while the process is running, `/ready`
+    answers 200 once the gateway is connected and the images are ready,
+    503 otherwise. Both return the details as JSON.
+    """
+
+    def __init__(
+        self,
+        gateway_check: Callable[[], dict[int, bool]],
+        port: Optional[int] = None,
+    ) -> None:
+        # Connection state of every shard
+        self.gateway_check = gateway_check
+        self.port = port if port is not None else int(os.getenv("HEALTH_PORT", "8001"))
+
+        self.assets_state = ASSETS_PENDING
+        ASSETS_STATE_ENUM.state(ASSETS_PENDING)
+
+        self._server: ThreadingHTTPServer = None
+
+    @property
+    def assets_ready(self) -> bool:
+        return self.assets_state == ASSETS_READY
+
+    def set_assets_state(self, state: str):
+        log.info(f"Assets are {state}")
+        self.assets_state = state
+        ASSETS_STATE_ENUM.state(state)
+
+    def get_status(self) -> tuple[bool, dict]:
+        """If the bot is ready, with the details"""
+        shards = self.gateway_check()
+        connected = len(shards) > 0 and all(shards.values())
+
+        return connected and self.assets_ready, {
+            "gateway": {
+                "connected": connected,
+                "shards": {str(shard): up for shard, up in shards.items()},
+            },
+            "assets": self.assets_state,
+        }
+
+    def start(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/health", "/ready"):
+                    self.send_error(404)
+                    return
+
+                ready, status = service.get_status()
+                status["ready"] = ready
+
+                code = 200
+                if self.path == "/ready" and not ready:
+                    code = 503
+
+                body = json.dumps(status).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                log.debug(format % args)
+
+        self._server = ThreadingHTTPServer(("", self.port), Handler)
+        self._server.daemon_threads = True
+
+        threading.Thread(
+            target=self._server.serve_forever, name="health", daemon=True
+        ).start()
+
+        log.info(f"Health server listening on port {self.port}")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
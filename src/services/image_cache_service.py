@@ -0,0 +1,139 @@
+import os
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Optional
+from prometheus_client import Counter, Gauge
+from services.image_service import TMP_FILE_PREFIX, HIDDEN, REVEALED, get_encoding
+from services.archive_service import ArchiveService
+
+log = logging.getLogger(__name__)
+
+IMAGE_CACHE_COUNTER = Counter(
+    "pokeguess_image_cache_requests",
+    "Image reads served from the cache (hit), the archive or from the disk (miss)",
+    ["result"],
+)
+IMAGE_CACHE_EVICTION_COUNTER = Counter(
+    "pokeguess_image_cache_evictions",
+    "How many images were evicted from the cache to stay under the memory cap",
+)
+IMAGE_CACHE_SIZE_GAUGE = Gauge(
+    "pokeguess_image_cache_bytes", "Size of the images held in the cache"
+)
+
+
+class ImageCacheService:
+    """
+    Least recently used cache of the encoded pokemon images, keyed by pokemon
+    id and variant (hidden or revealed).
+
+    When the archive is loaded, images are served from it and never cached.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        archive_service: Optional[ArchiveService] = None,
+    ) -> None:
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else int(float(os.getenv("IMAGE_CACHE_SIZE_MB", "64")) * 1024 * 1024)
+        )
+
+        self._images: OrderedDict[tuple[int, str], bytes] = OrderedDict()
+        self._size = 0
+
+        # Preloading happens in another thread
+        self._lock = threading.Lock()
+
+        self.archive_service = archive_service
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def get_image(self, pokemon_id: int, variant: str, path: Path) -> bytes:
+        """Returns the content of the image, reading it from the path on a miss"""
+        if self.archive_service is not None:
+            data = self.archive_service.get_image(pokemon_id, variant)
+            if data is not None:
+                IMAGE_CACHE_COUNTER.labels("archive").inc()
+                return data
+
+        key = (pokemon_id, variant)
+
+        with self._lock:
+            data = self._images.get(key)
+            if data is not None:
+                self._images.move_to_end(key)
+                IMAGE_CACHE_COUNTER.labels("hit").inc()
+                return data
+
+        IMAGE_CACHE_COUNTER.labels("miss").inc()
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        self.put_image(pokemon_id, variant, data)
+
+        return data
+
+    def put_image(self, pokemon_id: int, variant: str, data: bytes):
+        # Would evict the whole cache for nothing
+        if len(data) > self.max_bytes:
+            return
+
+        key = (pokemon_id, variant)
+
+        with self._lock:
+            previous = self._images.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+
+            self._images[key] = data
+            self._size += len(data)
+
+            while self._size > self.max_bytes:
+                _, evicted = self._images.popitem(last=False)
+                self._size -= len(evicted)
+                IMAGE_CACHE_EVICTION_COUNTER.inc()
+
+            IMAGE_CACHE_SIZE_GAUGE.set(self._size)
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._size = 0
+            IMAGE_CACHE_SIZE_GAUGE.set(0)
+
+    def preload(self, hidden_dir: Path, revealed_dir: Path):
+        """Loads every image of the directories until the cache is full"""
+        # Served from the memory-mapped archive, the cache would only copy it
+        if self.archive_service is not None and self.archive_service.loaded:
+            log.info("The images are served from the archive, skipping the preload")
+            return
+
+        log.info("Preloading the image cache")
+        extension = get_encoding().extension
+
+        for variant, directory in ((HIDDEN, hidden_dir), (REVEALED, revealed_dir)):
+            for file in os.listdir(directory):
+                if file.startswith(TMP_FILE_PREFIX) or not file.endswith(extension):
+                    continue
+
+                with open(Path(directory, file), "rb") as f:
+                    data = f.read()
+
+                if self._size + len(data) > self.max_bytes:
+                    log.warning("Image cache is full, stopping the preload")
+                    return
+
+                self.put_image(int(file.split("_")[0]), variant, data)
+
+        log.info(f"Preloaded {len(self)} images ({self._size} bytes)")
@@ -1,7 +1,14 @@
 from datetime import datetime
+import io
+import json
+import hashlib
 from pathlib import Path
 import logging
 import os
+import struct
+import tempfile
+from dataclasses import dataclass, field
+from typing import Optional
 from PIL import Image
 
 log = logging.getLogger(__name__)
@@ -16,37 +23,164 @@ OUTLINE_OFFSET = (-1, -1)
 SHADOW_COLOR = (0, 0, 0, 135)
 SHADOW_OFFSET = (-6, 8)
 
+# Increase when a change to the rendering code changes the images
+RENDER_VERSION = 1
 
-class ImageService:
-    def __init__(self) -> None:
-        # Cached background image
-        self._background_image: Image.Image = None
+# Images are written under this prefix first, then renamed to their final name
+TMP_FILE_PREFIX = ".tmp-"
+
+# Image variants of a pokemon
+HIDDEN = "hidden"
+REVEALED = "revealed"
+
+# Signature, IHDR chunk length and type, width and height
+PNG_HEADER = struct.Struct(">8sI4sII")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class ImageServiceException(Exception):
+    pass
 
-    def make_silhouette(
-        self, img: Image.Image, color: tuple[int], offset: tuple[int]
-    ) -> Image.Image:
-        silhouette = Image.new(img.mode, img.size, (0, 0, 0, 0))
 
-        for x in range(img.size[0]):
-            if (x + offset[0]) >= img.size[0] or (x + offset[0]) < 0:
-                continue
+class InvalidImageException(ImageServiceException):
+    pass
 
-            for y in range(img.size[1]):
-                original_pos = (x, y)
-                original_pixel = img.getpixel(original_pos)
 
-                silhouette_pos = (x + offset[0], y + offset[1])
+class ImageTooLargeException(ImageServiceException):
+    pass
+
+
+@dataclass(frozen=True)
+class ImageEncoding:
+    extension: str
+    format: str
+    options: dict = field(default_factory=dict)
+    # Reduces the image to a palette of this many colors before saving
+    colors: Optional[int] = None
+
+
+ENCODINGS: dict[str, ImageEncoding] = {
+    "png": ImageEncoding(".png", "PNG"),
+    "png-optimized": ImageEncoding(".png", "PNG", {"optimize": True}),
+    "png-quantized": ImageEncoding(".png", "PNG", {"optimize": True}, colors=256),
+    "webp-lossless": ImageEncoding(
+        ".webp", "WEBP", {"lossless": True, "quality": 80, "method": 4}
+    ),
+}
+
+
+def get_encoding(name: Optional[str] = None) -> ImageEncoding:
+    """The encoding by name, defaults to the IMAGE_ENCODING environment variable"""
+    name = name or os.getenv("IMAGE_ENCODING", "png")
+
+    if name not in ENCODINGS:
+        raise ValueError(
+            f"Unknown image encoding '{name}', use one of {', '.join(ENCODINGS)}"
+        )
+
+    return ENCODINGS[name]
 
-                if silhouette_pos[1] >= img.size[1] or silhouette_pos[1] < 0:
-                    continue
 
-                opacity = int((color[3] / 255) * original_pixel[3])
+def get_render_parameters_hash(encoding: Optional[ImageEncoding] = None) -> str:
+    """
+    Hash of everything that changes the rendered images, two renders of the same
+    original with the same hash give the same images.
+    """
+    encoding = encoding or get_encoding()
 
-                new_pixel = (color[0], color[1], color[2], opacity)
+    with open(BACKGROUND_PATH, "rb") as f:
+        background_hash = hashlib.sha256(f.read()).hexdigest()
 
-                silhouette.putpixel(silhouette_pos, new_pixel)
+    parameters = {
+        "version": RENDER_VERSION,
+        "background": background_hash,
+        "background_size": BACKGROUND_SIZE,
+        "pokemon_size": POKEMON_SIZE,
+        "main_color": MAIN_COLOR,
+        "outline_color": OUTLINE_COLOR,
+        "outline_offset": OUTLINE_OFFSET,
+        "shadow_color": SHADOW_COLOR,
+        "shadow_offset": SHADOW_OFFSET,
+        "encoding": [
+            encoding.extension,
+            encoding.format,
+            encoding.options,
+            encoding.colors,
+        ],
+    }
 
-        return silhouette
+    return hashlib.sha256(
+        json.dumps(parameters, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def read_png_size(data: bytes) -> tuple[int, int]:
+    """Width and height from the PNG header, without decoding the image"""
+    if len(data) < PNG_HEADER.size:
+        raise InvalidImageException("Too short to be a PNG")
+
+    signature, _, chunk_type, width, height = PNG_HEADER.unpack_from(data)
+
+    if signature != PNG_SIGNATURE or chunk_type != b"IHDR":
+        raise InvalidImageException("Not a PNG")
+
+    if width == 0 or height == 0:
+        raise InvalidImageException(f"Invalid size {width}x{height}")
+
+    return width, height
+
+
+class ImageService:
+    def __init__(self, encoding: Optional[str] = None) -> None:
+        # Cached background image
+        self._background_image: Image.Image = None
+
+        # Format of the hidden and revealed images
+        self.encoding = get_encoding(encoding)
+
+    def make_silhouette(
+        self, img: Image.Image, color: tuple[int], offset: tuple[int]
+    ) -> Image.Image:
+        return self.make_silhouettes(img, [(color, offset)])[0]
+
+    def make_silhouettes(
+        self, img: Image.Image, layers: list[tuple[tuple[int], tuple[int]]]
+    ) -> list[Image.Image]:
+        """
+        Creates one silhouette per (color, offset) pair from the alpha channel
+        of the image. The alpha channel is only extracted once and every
+        silhouette is built with whole-image band operations.
+        """
+        alpha = img.getchannel("A")
+        width, height = img.size
+
+        silhouettes = []
+        for color, offset in layers:
+            # Same rounding as scaling each pixel's alpha by the color's alpha
+            opacity_table = [int((color[3] / 255) * a) for a in range(256)]
+
+            colored = Image.new("RGBA", img.size, (color[0], color[1], color[2], 0))
+            colored.putalpha(alpha.point(opacity_table))
+
+            # Only the part of the image that stays in bounds once shifted is
+            # copied, the rest of the silhouette stays fully transparent
+            source_box = (
+                max(0, -offset[0]),
+                max(0, -offset[1]),
+                min(width, width - offset[0]),
+                min(height, height - offset[1]),
+            )
+
+            silhouette = Image.new(img.mode, img.size, (0, 0, 0, 0))
+            if source_box[0] < source_box[2] and source_box[1] < source_box[3]:
+                silhouette.paste(
+                    colored.crop(source_box),
+                    (max(0, offset[0]), max(0, offset[1])),
+                )
+
+            silhouettes.append(silhouette)
+
+        return silhouettes
 
     def layer_images(self, imgs: list[Image.Image]) -> Image.Image:
         first = imgs[0]
@@ -72,6 +206,23 @@ class ImageService:
 
         return self._background_image
 
+    def reduce(self, img: Image.Image, scale: tuple[int, int]) -> Image.Image:
+        """
+        Cheaply shrinks images much larger than the scale by an integer factor,
+        keeping at least twice the scale for the resize that follows
+        """
+        factor = max(img.size[0] // scale[0], img.size[1] // scale[1]) // 2
+        if factor < 2:
+            return img
+
+        log.info(f"Reducing a {img.size[0]}x{img.size[1]} image by {factor}")
+
+        # Reducing works on the colors, not on the palette indexes
+        if img.mode == "P":
+            img = img.convert(mode="RGBA")
+
+        return img.reduce(factor)
+
     def scale(self, img: Image.Image, scale: tuple[int, int]):
         """Scales while preserving the image ratio"""
         new_size = img.size
@@ -85,17 +236,46 @@ class ImageService:
 
         return img.resize(new_size)
 
-    def process_image(
-        self, original_path: Path, hidden_path: Path, revealed_path: Path
-    ):
-        log.info(f"Starting to process {original_path}")
-        start_time = datetime.now()
-
-        # Creating output directories
-        os.makedirs(hidden_path.parent, exist_ok=True)
-        os.makedirs(revealed_path.parent, exist_ok=True)
-
-        original_img = Image.open(original_path, "r")
+    def encode_image(self, img: Image.Image, file):
+        """Writes the image to the file (path or file object) with the encoding"""
+        if self.encoding.colors is not None:
+            # The renders are opaque, the RGB quantizer gives a better palette
+            if img.mode == "RGBA" and img.getchannel("A").getextrema() == (255, 255):
+                img = img.convert("RGB")
+
+            img = img.quantize(
+                colors=self.encoding.colors,
+                method=(
+                    Image.Quantize.MEDIANCUT
+                    if img.mode == "RGB"
+                    else Image.Quantize.FASTOCTREE
+                ),
+            )
+
+        img.save(file, format=self.encoding.format, **self.encoding.options)
+
+    def save_image(self, img: Image.Image, path: Path):
+        """
+        Saves the image atomically, an interrupted save never leaves a partial
+        file under the final path.
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=TMP_FILE_PREFIX, suffix=path.suffix, dir=path.parent
+        )
+        os.close(fd)
+
+        try:
+            self.encode_image(img, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def render_image(
+        self, original_img: Image.Image
+    ) -> tuple[Image.Image, Image.Image]:
+        """Creates the hidden and revealed images, returned in that order"""
+        original_img = self.reduce(original_img, POKEMON_SIZE)
         original_img = self.scale(original_img, POKEMON_SIZE)
 
         # Convert the image to RGBA
@@ -112,13 +292,20 @@ class ImageService:
 
         background_img = self.get_background_image()
 
-        shadow_img = self.make_silhouette(original_img, SHADOW_COLOR, SHADOW_OFFSET)
+        shadow_img, outline_img, main_img = self.make_silhouettes(
+            original_img,
+            [
+                (SHADOW_COLOR, SHADOW_OFFSET),
+                (OUTLINE_COLOR, OUTLINE_OFFSET),
+                (MAIN_COLOR, (0, 0)),
+            ],
+        )
 
         silhouette_img = self.layer_images(
             [
                 shadow_img,
-                self.make_silhouette(original_img, OUTLINE_COLOR, OUTLINE_OFFSET),
-                self.make_silhouette(original_img, MAIN_COLOR, (0, 0)),
+                outline_img,
+                main_img,
             ]
         )
 
@@ -148,9 +335,57 @@ class ImageService:
             ]
         )
 
+        return hidden_img, revealed_img
+
+    def process_image(
+        self, original_path: Path, hidden_path: Path, revealed_path: Path
+    ):
+        log.info(f"Starting to process {original_path}")
+        start_time = datetime.now()
+
+        # Creating output directories
+        os.makedirs(hidden_path.parent, exist_ok=True)
+        os.makedirs(revealed_path.parent, exist_ok=True)
+
+        original_img = Image.open(original_path, "r")
+        hidden_img, revealed_img = self.render_image(original_img)
+
         log.info(f"Saving {hidden_path}")
-        hidden_img.save(hidden_path)
+        self.save_image(hidden_img, hidden_path)
         log.info(f"Saving {revealed_path}")
-        revealed_img.save(revealed_path)
+        self.save_image(revealed_img, revealed_path)
 
         log.info(f"Done [{datetime.now() - start_time}]")
+
+    def process_image_bytes(
+        self, original: bytes, max_pixels: Optional[int] = None
+    ) -> tuple[bytes, bytes]:
+        """
+        Same as process_image without touching the file system, takes the
+        original PNG file content and returns the hidden and revealed image
+        file contents.
+
+        The PNG header is validated before anything is decoded, images with
+        more than `max_pixels` pixels are refused.
+        """
+        log.info(f"Starting to process an image of {len(original)} bytes")
+        start_time = datetime.now()
+
+        width, height = read_png_size(original)
+        if max_pixels is not None and width * height > max_pixels:
+            raise ImageTooLargeException(
+                f"{width}x{height} is more than {max_pixels} pixels"
+            )
+
+        original_img = Image.open(io.BytesIO(original), "r")
+        hidden_img, revealed_img = self.render_image(original_img)
+
+        outputs = []
+        for img in (hidden_img, revealed_img):
+            buffer = io.BytesIO()
+            self.encode_image(img, buffer)
+            outputs.append(buffer.getvalue())
+
+        log.info(f"Done [{datetime.now() - start_time}]")
+
+        return outputs[0], outputs[1]
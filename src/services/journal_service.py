@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Optional
+from discord.ext import tasks
+from models.guesser import Guesser
+from services.image_service import TMP_FILE_PREFIX
+
+log = logging.getLogger(__name__)
+
+JOURNAL_PATH = Path("./pokemons/games.journal")
+
+# Minimum records written before the journal is rewritten with only the
+# active games
+COMPACT_RECORDS = 10000
+
+
+def get_shard_id(guild_id: Optional[int], shard_count: int) -> int:
+    """Shard receiving the events of the guild, the first one for private messages"""
+    return 0 if guild_id is None else (guild_id >> 22) % shard_count
+
+
+def replay(path: Path) -> tuple[dict[int, dict], int, bool]:
+    """
+    Start records of the unfinished games of the journal by channel_id, with
+    the number of records and if the last one is complete
+    """
+    games: dict[int, dict] = {}
+    lines = 0
+    line = "\n"
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            lines += 1
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Partly written by a crash, only the last line can be
+                log.warning(f"Skipping corrupted record at line {lines} of {path}")
+                continue
+
+            if record["op"] == "start":
+                games[record["channel"]] = record
+            elif record["op"] == "end":
+                games.pop(record["channel"], None)
+            elif record["op"] == "hint" and record["channel"] in games:
+                games[record["channel"]]["hints"] += 1
+
+    return games, lines, line.endswith("\n")
+
+
+def write_journal(path: Path, data: str):
+    """Replaces the journal at once, a crash leaves the previous one"""
+    fd, tmp_path = tempfile.mkstemp(prefix=TMP_FILE_PREFIX, dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class JournalService:
+    """
+    Append only journal of the games, one JSON record per line, so the
+    active games survive a restart.
+
+    Records are buffered and written with a single fsync every flush
+    interval, a crash loses at most the last interval. Custom games are not
+    journaled, their images only live in memory.
+    """
+
+    def __init__(
+        self, path: Optional[Path] = None, flush_interval: Optional[float] = None
+    ) -> None:
+        self.path = path or Path(os.getenv("JOURNAL_PATH", JOURNAL_PATH))
+        flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else float(os.getenv("JOURNAL_FLUSH_SECONDS", "1"))
+        )
+
+        # Guessers by channel_id, written again on every rewrite with their progress
+        self._active: dict[int, Guesser] = {}
+        # Start records of the games in the shards of another process, by
+        # channel_id, written again on every rewrite until the cluster launcher
+        # moves them to the journal of that process
+        self._kept: dict[int, str] = {}
+        self._buffer: list[str] = []
+        self._written = 0
+
+        # Writes happen in a worker thread, closing waits for them
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+        # pylint: disable=no-member
+        self.flush_loop.change_interval(seconds=flush_interval)
+        self.flush_loop.start()
+        # pylint: enable=no-member
+
+    def _append(self, record: dict):
+        self._buffer.append(json.dumps(record) + "\n")
+
+    def _start_record(self, guesser: Guesser) -> dict:
+        guild = getattr(guesser.channel, "guild", None)
+
+        return {
+            "op": "start",
+            "channel": guesser.channel.id,
+            # Finds the shard of the channel, None in private messages
+            "guild": guild.id if guild is not None else None,
+            "pokemon": guesser.pokemon.id,
+            "file": guesser.pokemon.hidden_img_path.name,
+            "start": guesser.start_time.isoformat(),
+            "end": guesser.end_time.isoformat(),
+            "author": guesser.author.id,
+            "guesses": guesser.total_guesses,
+            "hints": guesser.hints_given,
+        }
+
+    def start(self, guesser: Guesser, restored: bool = False):
+        if guesser.custom:
+            return
+
+        self._active[guesser.channel.id] = guesser
+        self._kept.pop(guesser.channel.id, None)
+
+        # Already in the journal
+        if not restored:
+            self._append(self._start_record(guesser))
+
+    def keep(self, record: dict):
+        """Keeps an unfinished game of `load` that this process does not run"""
+        self._kept[record["channel"]] = (
+            json.dumps(
+                {
+                    **record,
+                    "start": record["start"].isoformat(),
+                    "end": record["end"].isoformat(),
+                }
+            )
+            + "\n"
+        )
+
+    def hint(self, guesser: Guesser):
+        if guesser.channel.id in self._active:
+            self._append({"op": "hint", "channel": guesser.channel.id})
+
+    def end(self, guesser: Guesser):
+        if self._active.pop(guesser.channel.id, None) is not None:
+            self._append({"op": "end", "channel": guesser.channel.id})
+
+    def load(self) -> list[dict]:
+        """Replays the journal, returns the start record of the unfinished games"""
+        start_time = time.perf_counter()
+
+        games, lines, complete = replay(self.path)
+
+        # The next records must not be appended to a partly written one
+        if not complete:
+            self._write("\n")
+
+        for record in games.values():
+            record["start"] = datetime.fromisoformat(record["start"])
+            record["end"] = datetime.fromisoformat(record["end"])
+
+        log.info(
+            f"Replayed {lines} records in {(time.perf_counter() - start_time) * 1000:.1f}ms, "
+            f"{len(games)} unfinished games"
+        )
+
+        return list(games.values())
+
+    def _write(self, data: str):
+        with self._lock:
+            # Closed while this flush waited, the journal was rewritten
+            if self._file.closed:
+                return
+
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _rewrite(self, data: str):
+        with self._lock:
+            if self._file.closed:
+                return
+
+            self._replace(data)
+
+    def _replace(self, data: str):
+        """Replaces the journal by the records of the active games, holding the lock"""
+        self._file.close()
+
+        try:
+            write_journal(self.path, data)
+        finally:
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def _take_pending(self, rewrite: bool = False) -> tuple[str, bool]:
+        """Data to write, and if it replaces the journal"""
+        self._written += len(self._buffer)
+
+        # Mostly finished games, cheaper to only keep the active ones
+        games = len(self._active) + len(self._kept)
+        if rewrite or self._written >= max(COMPACT_RECORDS, 2 * games):
+            self._buffer = []
+            self._written = games
+            return (
+                "".join(
+                    json.dumps(self._start_record(guesser)) + "\n"
+                    for guesser in self._active.values()
+                )
+                + "".join(self._kept.values()),
+                True,
+            )
+
+        data = "".join(self._buffer)
+        self._buffer = []
+        return data, False
+
+    @tasks.loop(seconds=1)
+    async def flush_loop(self):
+        if len(self._buffer) == 0:
+            return
+
+        try:
+            data, rewrite = self._take_pending()
+            await asyncio.to_thread(self._rewrite if rewrite else self._write, data)
+        except OSError:
+            log.exception(f"Could not write the journal {self.path}")
+
+    def close(self):
+        """Writes the progress of the active games, to be resumed on the next start"""
+        # pylint: disable=no-member
+        self.flush_loop.cancel()
+        # pylint: enable=no-member
+
+        data, _ = self._take_pending(rewrite=True)
+
+        # The cancelled flush may still be writing in its thread, waits for it
+        with self._lock:
+            try:
+                self._replace(data)
+            finally:
+                self._file.close()
+
+        log.info(
+            f"Saved {len(self._active)} active games and {len(self._kept)} games "
+            f"of other shards in {self.path}"
+        )
@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Optional
+from prometheus_client import Counter, Gauge, Histogram
+
+log = logging.getLogger(__name__)
+
+LOOP_LAG_HISTOGRAM = Histogram(
+    "pokeguess_event_loop_lag_seconds",
+    "How late the event loop woke up a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOOP_LAG_GAUGE = Gauge(
+    "pokeguess_event_loop_lag_last_seconds", "Last measured event loop lag"
+)
+LOOP_BLOCKED_COUNTER = Counter(
+    "pokeguess_event_loop_blocked",
+    "How many times a callback blocked the event loop past the threshold",
+)
+
+
+class LoopMonitorService:
+    """
+    Measures the event loop lag with a task that sleeps `interval` seconds
+    and checks how late it wakes up.
+
+    A watchdog thread checks that the task keeps waking up. When the loop is
+    stuck for more than `threshold` seconds, it logs the task running and the
+    stack of the loop thread, while the blocking call is still running.
+    """
+
+    def __init__(
+        self, threshold: Optional[float] = None, interval: Optional[float] = None
+    ) -> None:
+        self.threshold = (
+            threshold
+            if threshold is not None
+            else float(os.getenv("LOOP_BLOCK_THRESHOLD_SECONDS", "0.5"))
+        )
+        self.interval = interval if interval is not None else 0.25
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = threading.Event()
+
+        # Last time the task woke up, written by the loop, read by the watchdog
+        self._last_beat = 0.0
+
+    def start(self):
+        """Called from the event loop to monitor"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+
+        self._task = asyncio.create_task(self._measure())
+        threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+
+        log.info(
+            f"Monitoring the event loop, blocking calls over {self.threshold}s are logged"
+        )
+
+    def stop(self):
+        self._stopped.set()
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _measure(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._last_beat = time.monotonic()
+
+            lag = max(self._last_beat - start - self.interval, 0)
+            LOOP_LAG_HISTOGRAM.observe(lag)
+            LOOP_LAG_GAUGE.set(lag)
+
+            # Already reported by the watchdog while it was blocked, with the stack
+            if lag > self.threshold:
+                log.debug(f"The event loop was blocked for {lag:.3f}s in total")
+
+    def _watch(self):
+        reported_beat = None
+
+        while not self._stopped.wait(self.interval):
+            beat = self._last_beat
+            blocked = time.monotonic() - beat - self.interval
+
+            # Reported once per blocking call
+            if blocked > self.threshold and beat != reported_beat:
+                reported_beat = beat
+                LOOP_BLOCKED_COUNTER.inc()
+                self._report(blocked)
+
+    def _report(self, blocked: float):
+        frame = sys._current_frames().get(  # pylint: disable=protected-access
+            self._loop_thread_id
+        )
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+
+        task = asyncio.current_task(self._loop)
+        if task is not None:
+            coro = task.get_coro()
+            running = f"task {task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        else:
+            running = "a callback outside of any task"
+
+        log.warning(
+            f"The event loop is blocked for {blocked:.3f}s by {running}, "
+            f"loop thread stack:\n{stack}"
+        )
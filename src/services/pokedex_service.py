@@ -1,16 +1,31 @@
 import os
+import time
 import shutil
+import tempfile
+import threading
 from datetime import datetime
 from pathlib import Path
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+from urllib.parse import urlparse
 import json
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from services.image_service import TMP_FILE_PREFIX
 
 log = logging.getLogger(__name__)
 
 OUT_DIR = Path("./pokemons/originals/")
 POKEDEX = Path("./pokemons/pokedex.json")
+# ETag and Last-Modified of the saved pokedex, for conditional requests
+POKEDEX_VALIDATORS = Path("./pokemons/pokedex.validators.json")
+POKEDEX_URL = "https://www.pokemon.com/us/api/pokedex"
+
+# Seconds to connect and between two received bytes
+REQUEST_TIMEOUT = 30
 
 
 @dataclass
@@ -34,9 +49,70 @@ class Pokemon:
     def file_name(self) -> str:
         return str(self.id) + "_" + self.name.replace(":", "") + ".png"
 
+    @classmethod
+    def from_entry(cls, entry: dict) -> "Pokemon":
+        """Ignores the fields added to the pokedex since this class was written"""
+        names = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in entry.items() if key in names})
+
+
+class HostRateLimiter:
+    """Spaces out the requests made to a same host, shared between threads"""
+
+    def __init__(self, requests_per_second: float) -> None:
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._next_time: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url: str):
+        if self.interval == 0:
+            return
+
+        host = urlparse(url).netloc
+
+        with self._lock:
+            now = time.monotonic()
+            request_time = max(now, self._next_time.get(host, now))
+            self._next_time[host] = request_time + self.interval
+
+        if request_time > now:
+            time.sleep(request_time - now)
+
 
 class PokedexService:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        requests_per_second: Optional[float] = None,
+        retries: Optional[int] = None,
+    ) -> None:
+        self.workers = workers or int(os.getenv("DOWNLOAD_WORKERS", "8"))
+        requests_per_second = (
+            requests_per_second
+            if requests_per_second is not None
+            else float(os.getenv("DOWNLOAD_RATE_LIMIT", "20"))
+        )
+        retries = (
+            retries if retries is not None else int(os.getenv("DOWNLOAD_RETRIES", "3"))
+        )
+
+        # One keep-alive connection per worker, failed requests are retried with backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=self.workers,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET",),
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+
         # create directory if it does not exists
         if not OUT_DIR.exists():
             log.info(f"Creating directory {OUT_DIR}")
@@ -57,63 +133,220 @@ class PokedexService:
 
         # else, download the pokedex
         else:
-            log.info("Getting the Pokedex")
-            url = "https://www.pokemon.com/us/api/pokedex"
+            data = self.fetch_pokedex(conditional=False)
 
-            log.info("Request to " + url)
-            response = requests.get(url)
+        return [Pokemon.from_entry(entry) for entry in data]
 
-            response.raise_for_status()
+    def fetch_pokedex(self, conditional: bool) -> Optional[list[dict]]:
+        """
+        Downloads and saves the pokedex. When conditional, the request is made
+        with the validators of the saved pokedex and None is returned if it did
+        not change.
+        """
+        log.info("Getting the Pokedex")
+        url = POKEDEX_URL
 
-            data = response.json()
+        headers = {}
+        if conditional and POKEDEX_VALIDATORS.exists():
+            with open(POKEDEX_VALIDATORS, "r", encoding="utf-8") as f:
+                validators = json.load(f)
 
-            log.info("Saving the Pokedex")
-            with open(POKEDEX, "w", encoding="utf-8") as f:
+            if validators.get("etag") is not None:
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified") is not None:
+                headers["If-Modified-Since"] = validators["last_modified"]
+
+        log.info("Request to " + url)
+        self.rate_limiter.wait(url)
+        response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+
+        if response.status_code == 304:
+            log.info("The Pokedex did not change")
+            return None
+
+        response.raise_for_status()
+
+        data = response.json()
+
+        log.info("Saving the Pokedex")
+        self.save_json(POKEDEX, data)
+        self.save_json(
+            POKEDEX_VALIDATORS,
+            {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            },
+        )
+
+        return data
+
+    def save_json(self, path: Path, data):
+        fd, tmp_path = tempfile.mkstemp(prefix=TMP_FILE_PREFIX, dir=path.parent)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
                 json.dump(data, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def refresh_pokedex(self) -> list[Pokemon]:
+        """
+        Downloads the pokedex again if it changed, returns the pokemons that
+        are new or that changed name or image. Their previous image is removed
+        so they are downloaded and rendered again.
+        """
+        if not POKEDEX.exists():
+            return self.get_all_pokemons()
+
+        with open(POKEDEX, "r", encoding="utf-8") as f:
+            previous = {}
+            for entry in json.load(f):
+                previous.setdefault(entry["id"], entry)
 
-        return [Pokemon(**entry) for entry in data]
+        data = self.fetch_pokedex(conditional=True)
+        if data is None:
+            return []
+
+        changed: dict[int, Pokemon] = {}
+        seen: set[int] = set()
+        for entry in data:
+            # some pokemons are listed twice, the first one is used
+            if entry["id"] in seen:
+                continue
+            seen.add(entry["id"])
+
+            old_entry = previous.get(entry["id"])
+            if (
+                old_entry is not None
+                and old_entry["name"] == entry["name"]
+                and old_entry["ThumbnailImage"] == entry["ThumbnailImage"]
+            ):
+                continue
+
+            changed[entry["id"]] = Pokemon.from_entry(entry)
+
+        for file in os.listdir(OUT_DIR):
+            if file.startswith(TMP_FILE_PREFIX):
+                continue
+
+            if int(file.split("_")[0]) in changed:
+                log.info(f"Removing outdated image {file}")
+                os.remove(Path(OUT_DIR, file))
+
+        new = len([pokemon_id for pokemon_id in changed if pokemon_id not in previous])
+        log.info(
+            f"Pokedex refreshed, {new} new and {len(changed) - new} changed pokemons"
+        )
+
+        return list(changed.values())
 
     def get_downloaded_ids(self) -> list[int]:
         """Look into the out directory for files that was already downloaded"""
 
         ids: list[int] = []
         for file in os.listdir(OUT_DIR):
+            # Unfinished download
+            if file.startswith(TMP_FILE_PREFIX):
+                continue
+
             ids.append(int(file.split("_")[0]))
 
         return ids
 
-    def download_image(self, pokemon: Pokemon):
+    def remove_temporary_files(self):
+        """Removes the downloads that were interrupted"""
+        for file in os.listdir(OUT_DIR):
+            if file.startswith(TMP_FILE_PREFIX):
+                log.info(f"Removing unfinished download {file}")
+                os.remove(Path(OUT_DIR, file))
+
+    def download_image(self, pokemon: Pokemon) -> int:
+        """Downloads the pokemon image, returns its size in bytes"""
         start_time = datetime.now()
         log.info(f"Starting download of pokemon #{pokemon.id} {pokemon.name}")
 
-        response = requests.get(pokemon.ThumbnailImage, stream=True)
+        self.rate_limiter.wait(pokemon.ThumbnailImage)
+        with self.session.get(
+            pokemon.ThumbnailImage, stream=True, timeout=REQUEST_TIMEOUT
+        ) as response:
+            response.raise_for_status()
 
-        response.raise_for_status()
+            file_path = Path(OUT_DIR, pokemon.file_name)
+
+            # Downloaded next to the final file, renamed only once complete
+            fd, tmp_path = tempfile.mkstemp(prefix=TMP_FILE_PREFIX, dir=OUT_DIR)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    shutil.copyfileobj(response.raw, f)
+                    size = f.tell()
 
-        file_path = Path(OUT_DIR, pokemon.file_name)
+                expected_size = response.headers.get("Content-Length")
+                if expected_size is not None and int(expected_size) != size:
+                    raise IOError(
+                        f"Incomplete download, got {size} of {expected_size} bytes"
+                    )
 
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(response.raw, f)
+                os.replace(tmp_path, file_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
 
         log.info(f"Download successful [{datetime.now() - start_time}]")
 
-    def download_all_pokemon(self):
+        return size
+
+    def download_all_pokemon(self, refresh: bool = False):
+        """
+        Downloads the images that are missing, when refreshing the pokedex is
+        also checked for new or changed pokemons
+        """
+        self.remove_temporary_files()
+
+        if refresh:
+            self.refresh_pokedex()
+
         # get already downloaded images (in case the script failed at any point)
-        already_downloaded_ids: list[int] = self.get_downloaded_ids()
+        already_downloaded_ids: set[int] = set(self.get_downloaded_ids())
         pokemons = self.get_all_pokemons()
         log.info(f"There are {len(already_downloaded_ids)} images already downloaded")
 
-        # some pokemons are listed twice, but always following, this last id is to skip duplicates
-        last_id = 0
-
+        # some pokemons are listed twice, only the first one is downloaded
+        missing: dict[int, Pokemon] = {}
         for pokemon in pokemons:
-            if pokemon.id == last_id:
-                log.info("duplicated id, skipping...")
+            if pokemon.id in already_downloaded_ids or pokemon.id in missing:
                 continue
 
-            # if this image is already downloaded, skip
-            if pokemon.id in already_downloaded_ids:
-                continue
+            missing[pokemon.id] = pokemon
+
+        if len(missing) == 0:
+            return
+
+        log.info(f"Downloading {len(missing)} images with {self.workers} workers")
+
+        start_time = time.perf_counter()
+        downloaded = 0
+        total_bytes = 0
+        failed = 0
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                pool.submit(self.download_image, pokemon): pokemon
+                for pokemon in missing.values()
+            }
+
+            for future in as_completed(futures):
+                try:
+                    total_bytes += future.result()
+                    downloaded += 1
+                except Exception:
+                    failed += 1
+                    pokemon = futures[future]
+                    log.exception(f"Could not download pokemon #{pokemon.id}")
 
-            self.download_image(pokemon)
-            last_id = pokemon.id
+        elapsed = time.perf_counter() - start_time
+        log.info(
+            f"Downloaded {downloaded} images ({total_bytes / 1024 / 1024:.1f} MB) "
+            f"in {elapsed:.1f}s, {downloaded / elapsed:.1f} images/s, "
+            f"{total_bytes / 1024 / 1024 / elapsed:.2f} MB/s, {failed} failed"
+        )
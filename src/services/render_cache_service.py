@@ -0,0 +1,203 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Optional
+from prometheus_client import Counter, Gauge
+from services.image_service import TMP_FILE_PREFIX, HIDDEN, REVEALED
+
+log = logging.getLogger(__name__)
+
+RENDER_CACHE_DIR = Path("./pokemons/custom_cache/")
+
+RENDER_CACHE_COUNTER = Counter(
+    "pokeguess_render_cache_requests",
+    "Custom images found already rendered (hit) or not (miss)",
+    ["result"],
+)
+RENDER_CACHE_HIT_RATIO_GAUGE = Gauge(
+    "pokeguess_render_cache_hit_ratio",
+    "Ratio of custom images found already rendered since the bot started",
+)
+RENDER_CACHE_EVICTION_COUNTER = Counter(
+    "pokeguess_render_cache_evictions",
+    "How many renders were deleted to stay under the disk cap",
+)
+RENDER_CACHE_SIZE_GAUGE = Gauge(
+    "pokeguess_render_cache_bytes", "Size of the renders kept on disk"
+)
+
+
+class RenderCacheService:
+    """
+    Keeps the renders of custom images on disk, keyed by the hash of the
+    uploaded image and of the render parameters, with the pixel limit. The least recently used
+    renders are deleted past the size cap.
+
+    The file modification time is the last access, the order survives restarts.
+    """
+
+    def __init__(
+        self, directory: Optional[Path] = None, max_bytes: Optional[int] = None
+    ) -> None:
+        self.directory = directory or Path(
+            os.getenv("RENDER_CACHE_DIR", RENDER_CACHE_DIR)
+        )
+        self.max_bytes = (
+            max_bytes
+            if max_bytes is not None
+            else int(float(os.getenv("RENDER_CACHE_SIZE_MB", "256")) * 1024 * 1024)
+        )
+
+        # key -> size of both images, least recently used first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._size = 0
+
+        self._hits = 0
+        self._misses = 0
+
+        # Used from worker threads
+        self._lock = threading.Lock()
+
+        self._load()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def make_key(self, original: bytes, parameters_hash: str) -> str:
+        return hashlib.sha256(original + parameters_hash.encode("utf-8")).hexdigest()
+
+    def _get_path(self, key: str, variant: str) -> Path:
+        return Path(self.directory, f"{key}_{variant}")
+
+    def _load(self):
+        """Rebuilds the index from the files left by the previous runs"""
+        os.makedirs(self.directory, exist_ok=True)
+
+        found: dict[str, list] = {}
+        for file in os.listdir(self.directory):
+            path = Path(self.directory, file)
+
+            # Interrupted write
+            if file.startswith(TMP_FILE_PREFIX):
+                os.remove(path)
+                continue
+
+            # The caches of the cluster processes, not entries of this one
+            if path.is_dir():
+                continue
+
+            key, _, variant = file.rpartition("_")
+            stat = path.stat()
+            entry = found.setdefault(key, [0, 0.0, set()])
+            entry[0] += stat.st_size
+            entry[1] = max(entry[1], stat.st_mtime)
+            entry[2].add(variant)
+
+        for key, (size, _, variants) in sorted(found.items(), key=lambda e: e[1][1]):
+            # Both images are needed, remove the half written renders
+            if variants != {HIDDEN, REVEALED}:
+                for variant in variants:
+                    os.remove(self._get_path(key, variant))
+                continue
+
+            self._entries[key] = size
+            self._size += size
+
+        RENDER_CACHE_SIZE_GAUGE.set(self._size)
+        log.info(f"Found {len(self._entries)} cached renders ({self._size} bytes)")
+
+        self._evict()
+
+    def _count(self, hit: bool):
+        if hit:
+            self._hits += 1
+            RENDER_CACHE_COUNTER.labels("hit").inc()
+        else:
+            self._misses += 1
+            RENDER_CACHE_COUNTER.labels("miss").inc()
+
+        RENDER_CACHE_HIT_RATIO_GAUGE.set(self._hits / (self._hits + self._misses))
+
+    def get(self, key: str) -> Optional[tuple[bytes, bytes]]:
+        """The hidden and revealed images of this key, None if not rendered yet"""
+        with self._lock:
+            if key not in self._entries:
+                self._count(False)
+                return None
+
+            self._entries.move_to_end(key)
+
+            try:
+                images = []
+                for variant in (HIDDEN, REVEALED):
+                    path = self._get_path(key, variant)
+                    with open(path, "rb") as f:
+                        images.append(f.read())
+
+                    # Marks it as recently used for the next restart
+                    os.utime(path)
+            except OSError:
+                log.exception(f"Could not read the cached render {key}")
+                self._remove(key)
+                self._count(False)
+                return None
+
+            self._count(True)
+
+            return images[0], images[1]
+
+    def put(self, key: str, hidden: bytes, revealed: bytes):
+        size = len(hidden) + len(revealed)
+
+        # Would evict the whole cache for nothing
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+
+            for variant, data in ((HIDDEN, hidden), (REVEALED, revealed)):
+                fd, tmp_path = tempfile.mkstemp(
+                    prefix=TMP_FILE_PREFIX, dir=self.directory
+                )
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, self._get_path(key, variant))
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+
+            self._entries[key] = size
+            self._size += size
+
+            self._evict()
+
+            RENDER_CACHE_SIZE_GAUGE.set(self._size)
+
+    def _remove(self, key: str):
+        self._size -= self._entries.pop(key)
+
+        for variant in (HIDDEN, REVEALED):
+            try:
+                os.remove(self._get_path(key, variant))
+            except FileNotFoundError:
+                pass
+
+        RENDER_CACHE_SIZE_GAUGE.set(self._size)
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            key = next(iter(self._entries))
+            self._remove(key)
+            RENDER_CACHE_EVICTION_COUNTER.inc()
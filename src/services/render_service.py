@@ -0,0 +1,160 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from prometheus_client import Gauge, Histogram
+from services.image_service import ImageService, get_render_parameters_hash
+from services.render_cache_service import RenderCacheService
+
+log = logging.getLogger(__name__)
+
+RENDER_QUEUE_DEPTH_GAUGE = Gauge(
+    "pokeguess_render_queue_depth",
+    "How many custom images are waiting for or being rendered",
+)
+RENDER_WAIT_HISTOGRAM = Histogram(
+    "pokeguess_render_wait_seconds",
+    "Time a custom image waited in the queue before a worker started rendering it",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# One image service per worker process, keeps the background image cached
+_worker_image_service: ImageService = None
+
+
+def _init_worker():
+    global _worker_image_service
+    _worker_image_service = ImageService()
+
+
+def _render(original: bytes, max_pixels: int) -> tuple[float, bytes, bytes]:
+    """
+    Renders in the worker process, returns the time the render started with
+    the hidden and revealed images
+    """
+    start_time = time.time()
+    hidden, revealed = _worker_image_service.process_image_bytes(
+        original, max_pixels=max_pixels
+    )
+    return start_time, hidden, revealed
+
+
+class RenderServiceException(Exception):
+    pass
+
+
+class RenderQueueFullException(RenderServiceException):
+    pass
+
+
+class RenderService:
+    """
+    Renders custom images in worker processes so the event loop is never
+    blocked by image processing.
+
+    At most `workers` images are rendered at once and at most `queue_size`
+    more can wait for a worker, anything above that is refused.
+
+    Images that were already rendered are taken from the render cache.
+
+    Uploads are limited to `max_bytes` bytes and `max_pixels` pixels.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        render_cache_service: Optional[RenderCacheService] = None,
+    ) -> None:
+        self.workers = workers or int(os.getenv("RENDER_WORKERS", "2"))
+        self.queue_size = (
+            queue_size
+            if queue_size is not None
+            else int(os.getenv("RENDER_QUEUE_SIZE", "8"))
+        )
+
+        self.max_bytes = int(float(os.getenv("CUSTOM_IMAGE_MAX_MB", "8")) * 1024 * 1024)
+        self.max_pixels = int(os.getenv("CUSTOM_IMAGE_MAX_PIXELS", str(4096 * 4096)))
+
+        # Spawn instead of fork, the bot process is multithreaded
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+        # Renders waiting or running
+        self._pending = 0
+
+        self.render_cache_service = render_cache_service
+        self.parameters_hash = get_render_parameters_hash()
+
+        log.info(
+            f"Rendering with {self.workers} workers and a queue of {self.queue_size}"
+        )
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def is_full(self) -> bool:
+        return self._pending >= self.workers + self.queue_size
+
+    def is_too_large(
+        self, size: int, width: Optional[int], height: Optional[int]
+    ) -> bool:
+        """Checks the upload metadata, before anything is downloaded"""
+        if size > self.max_bytes:
+            return True
+
+        # Discord does not always know the dimensions
+        if width is not None and height is not None:
+            return width * height > self.max_pixels
+
+        return False
+
+    async def process_image(self, original: bytes) -> tuple[bytes, bytes]:
+        """Renders the image file content, returns the hidden and revealed images"""
+        cache_key = None
+        if self.render_cache_service is not None:
+            # Rendered under another pixel limit, an image now too large is not served
+            cache_key = self.render_cache_service.make_key(
+                original, f"{self.parameters_hash}:{self.max_pixels}"
+            )
+            cached = await asyncio.to_thread(self.render_cache_service.get, cache_key)
+            if cached is not None:
+                log.info(f"Render found in the cache ({cache_key})")
+                return cached
+
+        if self.is_full():
+            raise RenderQueueFullException()
+
+        self._pending += 1
+        RENDER_QUEUE_DEPTH_GAUGE.set(self._pending)
+
+        try:
+            loop = asyncio.get_running_loop()
+            submit_time = time.time()
+            start_time, hidden, revealed = await loop.run_in_executor(
+                self._executor, _render, original, self.max_pixels
+            )
+            RENDER_WAIT_HISTOGRAM.observe(max(0.0, start_time - submit_time))
+        finally:
+            self._pending -= 1
+            RENDER_QUEUE_DEPTH_GAUGE.set(self._pending)
+
+        if cache_key is not None:
+            try:
+                await asyncio.to_thread(
+                    self.render_cache_service.put, cache_key, hidden, revealed
+                )
+            except OSError:
+                log.exception("Could not cache the render")
+
+        return hidden, revealed
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,146 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from discord import Embed, Message, TextChannel, Member
+from prometheus_client import Counter
+
+log = logging.getLogger(__name__)
+
+POKEGUESS_REPLIES_COUNTER = Counter(
+    "pokeguess_replies",
+    "Replies to near misses and hints: sent, merged into another reply, or suppressed by the reveal",
+    ["kind", "result"],
+)
+
+
+@dataclass
+class PendingReplies:
+    # Sent at most once per window, the first reply of a quiet channel right away
+    last_sent: float = float("-inf")
+    timer: Optional[asyncio.TimerHandle] = None
+
+    # Last near miss message by author id, the embed is made for all the authors
+    close: dict[int, Message] = field(default_factory=dict)
+    close_embed: Optional[Callable[[list[Member]], Embed]] = None
+    close_requests: int = 0
+
+    # Made when sent, the hint shows one more letter only once per window
+    hint: Optional[Callable[[], Embed]] = None
+    hint_requests: int = 0
+
+
+class ReplyService:
+    """
+    Sends the replies to the near misses and hints of each channel, at most
+    one message per window. The replies asked in the meantime are merged into
+    that message, like one "So close! (3 players)" embed. The reveal is sent
+    right away and drops the replies still waiting.
+    """
+
+    def __init__(self, window: Optional[float] = None) -> None:
+        self.window = (
+            window
+            if window is not None
+            else float(os.getenv("REPLY_WINDOW_SECONDS", "1.5"))
+        )
+
+        # by channel_id
+        self._pending: dict[int, PendingReplies] = {}
+        # Replies being sent, keeps a reference to the tasks
+        self._sending: set[asyncio.Task] = set()
+
+    def close_answer(
+        self, message: Message, make_embed: Callable[[list[Member]], Embed]
+    ):
+        pending = self._pending.setdefault(message.channel.id, PendingReplies())
+        pending.close[message.author.id] = message
+        pending.close_embed = make_embed
+        pending.close_requests += 1
+        self._schedule(message.channel, pending)
+
+    def hint(self, channel: TextChannel, make_embed: Callable[[], Embed]):
+        pending = self._pending.setdefault(channel.id, PendingReplies())
+        if pending.hint is None:
+            pending.hint = make_embed
+        pending.hint_requests += 1
+        self._schedule(channel, pending)
+
+    def _schedule(self, channel: TextChannel, pending: PendingReplies):
+        if pending.timer is not None:
+            return
+
+        delay = max(pending.last_sent + self.window - time.monotonic(), 0)
+        pending.timer = asyncio.get_running_loop().call_later(
+            delay, self._flush, channel
+        )
+
+    def _flush(self, channel: TextChannel):
+        task = asyncio.create_task(self._send_pending(channel))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send_pending(self, channel: TextChannel):
+        pending = self._pending.get(channel.id)
+        if pending is None:
+            return
+
+        close = list(pending.close.values())
+        make_close = pending.close_embed
+        close_requests = pending.close_requests
+        make_hint = pending.hint
+        hint_requests = pending.hint_requests
+
+        pending.timer = None
+        pending.last_sent = time.monotonic()
+        pending.close = {}
+        pending.close_embed = None
+        pending.close_requests = 0
+        pending.hint = None
+        pending.hint_requests = 0
+
+        embeds = []
+        if len(close) > 0:
+            embeds.append(make_close([message.author for message in close]))
+            self._count("close", close_requests)
+        if make_hint is not None:
+            embeds.append(make_hint())
+            self._count("hint", hint_requests)
+
+        log.info(f"Sending {', '.join(type(embed).__name__ for embed in embeds)}")
+        try:
+            # The only player gets a reply, like before
+            if len(close) == 1:
+                await close[0].reply(embeds=embeds)
+            else:
+                await channel.send(embeds=embeds)
+        except Exception:
+            log.exception(f"Could not send the replies in channel {channel.id}")
+
+    def _count(self, kind: str, requests: int):
+        POKEGUESS_REPLIES_COUNTER.labels(kind, "sent").inc()
+        if requests > 1:
+            POKEGUESS_REPLIES_COUNTER.labels(kind, "merged").inc(requests - 1)
+
+    def forget(self, channel: TextChannel):
+        """
+        Drops the replies still waiting when the game of the channel ends, the
+        reveal is not sent behind them
+        """
+        pending = self._pending.pop(channel.id, None)
+        if pending is None:
+            return
+
+        if pending.timer is not None:
+            pending.timer.cancel()
+
+        if pending.close_requests > 0:
+            POKEGUESS_REPLIES_COUNTER.labels("close", "suppressed").inc(
+                pending.close_requests
+            )
+        if pending.hint_requests > 0:
+            POKEGUESS_REPLIES_COUNTER.labels("hint", "suppressed").inc(
+                pending.hint_requests
+            )
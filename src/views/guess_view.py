@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
 import random
-from discord import Embed, Color, File
+from discord import Embed, Color, File, Interaction, ButtonStyle, Member, ui
 from zalgo_text.zalgo import zalgo
 from models.guesser import Guesser
 
@@ -43,6 +44,13 @@ class GenericErrorEmbed(Embed):
         self.title = "An error happened, I Couldn't start the game"
 
 
+class WarmingUpEmbed(Embed):
+    def __init__(self):
+        super().__init__()
+        self.color = error_color
+        self.title = "I'm still warming up, the Pokemons will be ready in a moment."
+
+
 class ProcessingActiveEmbed(Embed):
     def __init__(self):
         super().__init__()
@@ -50,6 +58,22 @@ class ProcessingActiveEmbed(Embed):
         self.title = "Wait a minute! Someone else is posting a custom image"
 
 
+class ProcessingBusyEmbed(Embed):
+    def __init__(self):
+        super().__init__()
+        self.color = error_color
+        self.title = (
+            "I'm processing too many custom images right now, try again in a moment."
+        )
+
+
+class ImageTooLargeEmbed(Embed):
+    def __init__(self):
+        super().__init__()
+        self.color = error_color
+        self.title = "This image is too large, try a smaller one."
+
+
 class ProcessingFailedEmbed(Embed):
     def __init__(self):
         super().__init__()
@@ -85,12 +109,38 @@ class AlreadyActiveEmbed(Embed):
         self.title = "A guessing game is already active."
 
 
-class CloseAnswerEmbed(Embed):
+class NoActiveGuessEmbed(Embed):
+    def __init__(self):
+        super().__init__()
+        self.color = error_color
+        self.title = "There is no Pokemon to guess here, start a game with /pokeguess"
+
+
+class WrongAnswerEmbed(Embed):
     def __init__(self):
+        super().__init__()
+        self.color = hint_color
+        self.title = "That's not it."
+
+
+class CorrectAnswerEmbed(Embed):
+    def __init__(self):
+        super().__init__()
+        self.color = hint_color
+        self.title = "You got it!"
+
+
+class CloseAnswerEmbed(Embed):
+    def __init__(self, players: Optional[list[Member]] = None):
         super().__init__()
         self.color = hint_color
         self.title = random.choice(close_answer_text)
 
+        # Merged near misses of several players
+        if players is not None and len(players) > 1:
+            self.title += f" ({len(players)} players)"
+            self.description = " ".join(player.mention for player in players)
+
 
 class HintEmbed(Embed):
     def __init__(self, guesser: Guesser):
@@ -158,6 +208,39 @@ class RevealedEmbed(Embed):
             corrupt_embed(self)
 
 
+class GuessView(ui.View):
+    """Buttons of the hidden Pokemon, to play without reading the messages"""
+
+    def __init__(
+        self,
+        on_guess: Callable[[Interaction, str], Awaitable[None]],
+        on_hint: Callable[[Interaction], Awaitable[None]],
+    ):
+        # Persistent, the buttons keep working after a restart
+        super().__init__(timeout=None)
+        self.on_guess = on_guess
+        self.on_hint = on_hint
+
+    @ui.button(label="Guess", style=ButtonStyle.primary, custom_id="pokeguess:guess")
+    async def guess_button(self, interaction: Interaction, _: ui.Button):
+        await interaction.response.send_modal(GuessModal(self.on_guess))
+
+    @ui.button(label="Hint", style=ButtonStyle.secondary, custom_id="pokeguess:hint")
+    async def hint_button(self, interaction: Interaction, _: ui.Button):
+        await self.on_hint(interaction)
+
+
+class GuessModal(ui.Modal, title="Who's That Pokemon?"):
+    answer = ui.TextInput(label="Pokemon name", max_length=100)
+
+    def __init__(self, on_guess: Callable[[Interaction, str], Awaitable[None]]):
+        super().__init__()
+        self.on_guess = on_guess
+
+    async def on_submit(self, interaction: Interaction):
+        await self.on_guess(interaction, self.answer.value)
+
+
 def datetime_to_discord_timestamp(dt: datetime) -> str:
     # return int((d - datetime(1970, 1, 1)).total_seconds())
     return f"<t:{int(dt.replace(tzinfo=timezone.utc).timestamp())}:R>"
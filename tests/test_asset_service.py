@@ -0,0 +1,61 @@
+import shutil
+from pathlib import Path
+import pytest
+from PIL import Image
+from services.asset_service import (
+    AssetService,
+    ORIGINAL_DIR,
+    HIDDEN_DIR,
+    REVEALED_DIR,
+    get_output_file,
+    hash_file,
+)
+from services.image_service import BACKGROUND_PATH
+
+REPOSITORY = Path(__file__).resolve().parents[1]
+
+FILE = "0_Missingno.png"
+
+
+def save_original(color: tuple[int, int, int, int]):
+    image = Image.new("RGBA", (64, 64), (0, 0, 0, 0))
+    image.paste(color, (16, 16, 48, 48))
+    image.save(Path(ORIGINAL_DIR, FILE))
+
+
+@pytest.fixture(autouse=True)
+def pokemons(tmp_path, monkeypatch):
+    """Runs in an empty directory with the background and one original"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("IMAGE_ENCODING", "png")
+
+    BACKGROUND_PATH.parent.mkdir(parents=True)
+    shutil.copy(REPOSITORY / BACKGROUND_PATH, BACKGROUND_PATH)
+    ORIGINAL_DIR.mkdir(parents=True)
+
+    save_original((255, 0, 0, 255))
+    assert AssetService(jobs=1).build() == 1
+
+
+def test_edited_original_is_rendered_again():
+    revealed_path = Path(REVEALED_DIR, get_output_file(FILE))
+    revealed_hash = hash_file(revealed_path)
+
+    save_original((0, 0, 255, 255))
+
+    assert AssetService(jobs=1).verify() == 0
+    assert Path(ORIGINAL_DIR, FILE).exists()
+    assert not revealed_path.exists()
+
+    assert AssetService(jobs=1).build() == 1
+    assert hash_file(revealed_path) != revealed_hash
+
+
+def test_truncated_original_is_removed():
+    original_path = Path(ORIGINAL_DIR, FILE)
+    data = original_path.read_bytes()
+    original_path.write_bytes(data[: len(data) // 2])
+
+    assert AssetService(jobs=1).verify() == 1
+    assert not original_path.exists()
+    assert not Path(HIDDEN_DIR, get_output_file(FILE)).exists()
@@ -0,0 +1,110 @@
+import json
+import argparse
+from pathlib import Path
+import pytest
+from cluster import Cluster, JOURNAL_DIR
+from services.journal_service import get_shard_id, replay
+
+GAMES = 100
+# Games won or expired, their end is in the journal
+FINISHED_EVERY = 10
+
+
+def make_cluster(processes: int, shard_count: int) -> Cluster:
+    args = argparse.Namespace(
+        processes=processes, stub_gateway=False, metrics_port=8000, health_port=8100
+    )
+    cluster = Cluster(args)
+    cluster.make_workers(shard_count)
+    return cluster
+
+
+def make_records(channel_id: int) -> list[dict]:
+    records = [
+        {
+            "op": "start",
+            "channel": channel_id,
+            # A guild of each shard in turn
+            "guild": channel_id << 22,
+            "pokemon": 25,
+            "file": "25_Pikachu.png",
+            "start": "2024-01-01T00:00:00",
+            "end": "2024-01-01T00:01:00",
+            "author": 1,
+            "guesses": 0,
+            "hints": 0,
+        }
+    ]
+    if channel_id % FINISHED_EVERY == 0:
+        records.append({"op": "end", "channel": channel_id})
+    return records
+
+
+def write(path: Path, channel_ids: list[int]):
+    with open(path, "w", encoding="utf-8") as f:
+        for channel_id in channel_ids:
+            f.writelines(
+                json.dumps(record) + "\n" for record in make_records(channel_id)
+            )
+
+
+def get_unfinished() -> set[int]:
+    return {
+        channel_id
+        for channel_id in range(1, GAMES + 1)
+        if channel_id % FINISHED_EVERY != 0
+    }
+
+
+def assert_in_their_process(cluster: Cluster, shard_count: int):
+    """Every unfinished game is in the journal of the process running its shard"""
+    resumed = set()
+    for worker in cluster.workers:
+        games, _, _ = replay(Path(worker.env["JOURNAL_PATH"]))
+        for record in games.values():
+            assert get_shard_id(record["guild"], shard_count) in worker.shard_ids
+        resumed |= games.keys()
+
+    assert resumed == get_unfinished()
+
+    # Only the journals of the running processes are left
+    assert set(JOURNAL_DIR.iterdir()) == {
+        Path(worker.env["JOURNAL_PATH"]) for worker in cluster.workers
+    }
+
+
+@pytest.fixture(autouse=True)
+def directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    JOURNAL_DIR.mkdir()
+
+
+@pytest.mark.parametrize(
+    "processes, shard_count", [(4, 8), (3, 8), (2, 8), (6, 8), (4, 16), (3, 5)]
+)
+def test_games_move_to_the_process_of_their_shard(processes, shard_count):
+    # Played by 4 processes over 8 shards
+    before = make_cluster(4, 8)
+    for worker in before.workers:
+        write(
+            Path(worker.env["JOURNAL_PATH"]),
+            [
+                channel_id
+                for channel_id in range(1, GAMES + 1)
+                if get_shard_id(channel_id << 22, 8) in worker.shard_ids
+            ],
+        )
+
+    after = make_cluster(processes, shard_count)
+    after.split_journals(shard_count)
+
+    assert_in_their_process(after, shard_count)
+
+
+def test_games_of_a_single_process_are_split():
+    write(Path(JOURNAL_DIR, "games.journal"), list(range(1, GAMES + 1)))
+
+    cluster = make_cluster(3, 6)
+    cluster.split_journals(6)
+
+    assert_in_their_process(cluster, 6)
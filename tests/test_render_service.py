@@ -0,0 +1,46 @@
+import io
+import shutil
+import asyncio
+from pathlib import Path
+import pytest
+from PIL import Image
+from services.image_service import BACKGROUND_PATH, ImageTooLargeException
+from services.render_service import RenderService
+from services.render_cache_service import RenderCacheService
+
+REPOSITORY = Path(__file__).resolve().parents[1]
+
+
+def make_image(size: int) -> bytes:
+    data = io.BytesIO()
+    Image.new("RGBA", (size, size), (255, 0, 0, 255)).save(data, format="PNG")
+    return data.getvalue()
+
+
+async def render(original: bytes, cache_dir: Path) -> tuple[bytes, bytes]:
+    render_service = RenderService(
+        workers=1, render_cache_service=RenderCacheService(directory=cache_dir)
+    )
+    try:
+        return await render_service.process_image(original)
+    finally:
+        render_service.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    BACKGROUND_PATH.parent.mkdir(parents=True)
+    shutil.copy(REPOSITORY / BACKGROUND_PATH, BACKGROUND_PATH)
+
+
+def test_cached_render_is_not_served_over_a_lower_pixel_limit(tmp_path, monkeypatch):
+    original = make_image(64)
+    cache_dir = Path(tmp_path, "cache")
+
+    monkeypatch.setenv("CUSTOM_IMAGE_MAX_PIXELS", str(64 * 64))
+    asyncio.run(render(original, cache_dir))
+
+    monkeypatch.setenv("CUSTOM_IMAGE_MAX_PIXELS", str(32 * 32))
+    with pytest.raises(ImageTooLargeException):
+        asyncio.run(render(original, cache_dir))